@@ -1,14 +1,19 @@
 import os
 import sys
+import json
 import glob
+import shutil
 import subprocess
 import logging
 import time
 import threading
+from contextlib import nullcontext
 from datetime import datetime
 from pathlib import Path
 from dotenv import load_dotenv
 from prepare_backup import prepare_backup
+from gbk_reader import export_gbk, GbkFormatError
+from supervisor import StageSupervisor, StageStalled, StageCancelled, GBAK_PROGRESS, MIGRATION_PROGRESS
 
 # Nome do arquivo de log
 LOG_FILE = 'automacao.log'
@@ -33,22 +38,107 @@ logger.info("="*80)
 logger.info(f"Iniciando nova execução em {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
 logger.info("="*80)
 
-def read_output(pipe, log_func):
-    """Função para ler a saída em uma thread separada"""
-    for line in iter(pipe.readline, ''):
-        log_func(line.strip())
-    pipe.close()
+# Espaço já reservado em cada camada de scratch (compartilhado entre origens)
+_scratch_lock = threading.Lock()
+_scratch_reserved = {}
+# Bancos que não puderam ser removidos da camada: caminho -> (camada, bytes reservados).
+# O espaço continua reservado até que uma escolha de camada seguinte consiga removê-los
+_scratch_pending = {}
+
+# Caminho do npm após a instalação das dependências, feita uma única vez por processo
+_npm_lock = threading.Lock()
+_npm_path = None
+
+def parse_scratch_tiers(value):
+    """Converte SCRATCH_TIERS em uma lista de (diretório, limite em bytes ou None)
+
+    Formato: camadas separadas por ';', em ordem de preferência, cada uma com
+    um limite opcional em MB após '|'. Ex.: R:\\scratch|8192;D:\\rapido
+    """
+    tiers = []
+    for entry in value.split(';'):
+        entry = entry.strip()
+        if not entry:
+            continue
+        path, _, budget = entry.partition('|')
+        budget = int(float(budget) * 1024 * 1024) if budget.strip() else None
+        tiers.append((path.strip(), budget))
+    return tiers
 
 class FirebirdMigration:
-    def __init__(self):
-        self.gbk_dir = os.path.join(os.getcwd(), 'gbk')
-        self.database_dir = os.path.join(os.getcwd(), 'firebird', 'restored')
+    def __init__(self, source=None, limits=None, cancel_event=None):
+        # source: configuração de uma origem (ver multi_source.py); sem ela usa os caminhos padrão
+        source = source or {}
+        self.name = source.get('name', 'default')
+        self.gbk_dir = source.get('gbk_dir', os.path.join(os.getcwd(), 'gbk'))
+        self.gbk_path = source.get('gbk_path')  # Origem dos .7z; None usa GBK_PATH do .env
+        self.database_dir = source.get('database_dir', os.path.join(os.getcwd(), 'firebird', 'restored'))
         self.gbak_path = r'C:\Program Files\Firebird\Firebird_3_0\gbak.exe'
         self.gfix_path = r'C:\Program Files\Firebird\Firebird_3_0\gfix.exe'
-        self.db_path = os.path.join(self.database_dir, 'millenium.fdb')
+        self.database_name = source.get('database_name', 'millenium.fdb')
+        self.db_path = os.path.join(self.database_dir, self.database_name)
+        self.default_database_dir = self.database_dir
         self.user = 'sysdba'
         self.password = 'masterkey'
-        self.last_processed_file = os.path.join(os.getcwd(), 'last_processed.txt')
+        self.last_processed_file = source.get('ledger', os.path.join(os.getcwd(), 'last_processed.txt'))
+        self.metrics_file = source.get('metrics', os.path.join(os.getcwd(), 'run_metrics.jsonl'))
+        self.metrics = {}
+        self._scratch_reservation = None
+        self.stream_dir = None  # Tabelas lidas direto do GBK (GBK_DIRECT_READ)
+        self.npm_path = None
+        self.mongo_uri = source.get('mongo_uri')
+        self.mongo_db = source.get('mongo_db')
+        self.export_dir = source.get('export_dir')
+        self.batch_state_file = source.get('batch_state')  # Lotes ajustados da origem; None usa BATCH_STATE_FILE
+        self.index_state_file = source.get('index_state')  # Índices adiados da origem; None usa BULK_INDEX_FILE
+        # limits: semáforos globais compartilhados entre origens (None = sem limite)
+        self.limits = limits
+        # cancel_event: sinalizado pelo scheduler para interromper a execução entre/durante etapas
+        self.cancel_event = cancel_event
+
+    def run_stage(self, name, func, *args):
+        """Executa uma etapa, repetindo-a se o supervisor detectar travamento"""
+        max_retries = int(os.getenv('STAGE_MAX_RETRIES', '1'))
+        for attempt in range(max_retries + 1):
+            if self.cancel_event is not None and self.cancel_event.is_set():
+                raise StageCancelled(f"Execução cancelada antes da etapa {name}")
+            try:
+                return func(*args)
+            except StageStalled as e:
+                self.metrics[f'{name}_stalls'] = attempt + 1
+                if attempt == max_retries:
+                    raise
+                logger.warning(f"{str(e)}. Tentativa {attempt + 2} de {max_retries + 1}...")
+
+    def _slot(self, name):
+        """Retorna o semáforo global do recurso informado, ou um contexto vazio"""
+        if self.limits is None:
+            return nullcontext()
+        return getattr(self.limits, name)
+
+    def save_run_metrics(self):
+        """Acrescenta as métricas da execução atual ao arquivo de métricas (uma linha JSON por execução)"""
+        if not self.metrics:
+            return
+        try:
+            self.metrics['finished_at'] = datetime.now().isoformat(timespec='seconds')
+            with open(self.metrics_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(self.metrics) + '\n')
+        except Exception as e:
+            logger.warning(f"Erro ao salvar métricas da execução: {str(e)}")
+
+    def get_run_history(self):
+        """Lê as métricas das execuções anteriores"""
+        history = []
+        try:
+            if os.path.exists(self.metrics_file):
+                with open(self.metrics_file, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        if line.strip():
+                            history.append(json.loads(line))
+        except Exception as e:
+            logger.warning(f"Erro ao ler métricas anteriores: {str(e)}")
+        return history
 
     def get_last_processed_gbk(self):
         """Lê o último arquivo GBK processado"""
@@ -167,6 +257,99 @@ class FirebirdMigration:
                         logger.warning(f"Tentativa {attempt + 1} falhou, tentando novamente em 2 segundos...")
                         time.sleep(2)
 
+    def predict_restored_size(self, gbk_file):
+        """Estima o tamanho do banco restaurado a partir do tamanho do GBK
+
+        Usa a proporção banco/GBK da última restauração registrada nas métricas;
+        sem histórico, usa RESTORE_SIZE_RATIO do .env. Inclui margem de 10%.
+        """
+        ratio = float(os.getenv('RESTORE_SIZE_RATIO', '2.0'))
+        for run in reversed(self.get_run_history()):
+            if run.get('restored_db_size') and run.get('gbk_size'):
+                ratio = run['restored_db_size'] / run['gbk_size']
+                break
+        return int(os.path.getsize(gbk_file) * ratio * 1.1)
+
+    def select_scratch_tier(self, gbk_file):
+        """Escolhe onde restaurar o banco: a primeira camada de SCRATCH_TIERS
+        (tmpfs/RAM disk, disco rápido...) onde o tamanho previsto cabe, ou o
+        diretório padrão quando nenhuma comporta"""
+        load_dotenv()
+        predicted = self.predict_restored_size(gbk_file)
+        self.metrics['predicted_db_size'] = predicted
+        self.database_dir = self.default_database_dir
+
+        # Tenta de novo remover bancos que ficaram em camadas de scratch
+        with _scratch_lock:
+            pending = list(_scratch_pending.items())
+        for db_path, (tier_dir, reserved) in pending:
+            if self._remove_scratch_db(db_path):
+                with _scratch_lock:
+                    if _scratch_pending.pop(db_path, None) is not None:
+                        _scratch_reserved[tier_dir] = max(0, _scratch_reserved.get(tier_dir, 0) - reserved)
+
+        for tier_dir, budget in parse_scratch_tiers(os.getenv('SCRATCH_TIERS', '')):
+            target_dir = os.path.join(tier_dir, self.name)
+            try:
+                os.makedirs(target_dir, exist_ok=True)
+                free = shutil.disk_usage(target_dir).free
+            except OSError as e:
+                logger.warning(f"Camada de scratch indisponível ({tier_dir}): {str(e)}")
+                continue
+
+            with _scratch_lock:
+                reserved = _scratch_reserved.get(tier_dir, 0)
+                if budget is not None and reserved + predicted > budget:
+                    logger.info(f"Banco previsto ({predicted/1024/1024:.0f} MB) excede o limite de {tier_dir}")
+                    continue
+                if reserved + predicted > free:
+                    logger.info(f"Espaço livre insuficiente em {tier_dir} ({free/1024/1024:.0f} MB)")
+                    continue
+                _scratch_reserved[tier_dir] = reserved + predicted
+
+            self._scratch_reservation = (tier_dir, predicted)
+            self.database_dir = target_dir
+            break
+
+        self.db_path = os.path.join(self.database_dir, self.database_name)
+        self.metrics['scratch_tier'] = self._scratch_reservation[0] if self._scratch_reservation else 'default'
+        logger.info(f"Banco será restaurado em: {self.db_path}")
+
+    @staticmethod
+    def _remove_scratch_db(db_path):
+        """Remove um banco temporário; retorna False se o arquivo continuar no disco"""
+        try:
+            if os.path.exists(db_path):
+                os.remove(db_path)
+                logger.info(f"Banco temporário removido: {db_path}")
+            return True
+        except OSError as e:
+            logger.warning(f"Erro ao remover banco temporário {db_path}: {str(e)}")
+            return False
+
+    def release_scratch(self):
+        """Remove o banco de uma camada de scratch e libera o espaço reservado
+
+        Se o arquivo não puder ser removido (no Windows, comum enquanto o Firebird
+        ainda o mantém aberto), desconecta os usuários e tenta de novo; se ainda
+        assim falhar, o espaço continua reservado até uma próxima tentativa.
+        """
+        if self._scratch_reservation is None:
+            return
+        tier_dir, reserved = self._scratch_reservation
+        self._scratch_reservation = None
+
+        if not self._remove_scratch_db(self.db_path):
+            self.disconnect_all_users()
+            if not self._remove_scratch_db(self.db_path):
+                logger.warning(f"Espaço de {self.db_path} continua reservado em {tier_dir} até o arquivo ser removido")
+                with _scratch_lock:
+                    _scratch_pending[self.db_path] = (tier_dir, reserved)
+                return
+
+        with _scratch_lock:
+            _scratch_reserved[tier_dir] = max(0, _scratch_reserved.get(tier_dir, 0) - reserved)
+
     def restore_database(self, gbk_file):
         """Restaura o banco de dados usando gbak"""
         try:
@@ -189,29 +372,8 @@ class FirebirdMigration:
             logger.info(f"Comando: {' '.join(cmd)}")
             
             # Executa o comando
-            process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                encoding='latin1',
-                bufsize=1
-            )
-
-            # Cria threads para ler stdout e stderr
-            stdout_thread = threading.Thread(target=read_output, args=(process.stdout, logger.info))
-            stderr_thread = threading.Thread(target=read_output, args=(process.stderr, logger.error))
-            
-            # Inicia as threads
-            stdout_thread.start()
-            stderr_thread.start()
-            
-            # Aguarda o processo terminar
-            returncode = process.wait()
-            
-            # Aguarda as threads terminarem
-            stdout_thread.join()
-            stderr_thread.join()
+            supervisor = StageSupervisor('restauração', GBAK_PROGRESS, self.cancel_event)
+            returncode = supervisor.run(cmd, encoding='latin1')
 
             if returncode != 0:
                 raise Exception(f"Erro na restauração. Código de retorno: {returncode}")
@@ -223,6 +385,7 @@ class FirebirdMigration:
                 raise Exception("Arquivo do banco não foi criado")
             
             size = os.path.getsize(self.db_path)
+            self.metrics['restored_db_size'] = size
             logger.info(f"Tamanho do banco restaurado: {size/1024/1024:.2f} MB")
             
             if size == 0:
@@ -232,7 +395,50 @@ class FirebirdMigration:
             logger.error(f"Erro durante a restauração: {str(e)}")
             raise
 
+    def read_gbk_directly(self, gbk_file):
+        """Converte as tabelas do GBK em arquivos JSONL sem restaurar o banco
+
+        Retorna False quando o formato do GBK não é suportado pelo gbk_reader,
+        para que o processo siga pela restauração com gbak.
+        """
+        stream_dir = os.path.join(self.database_dir, 'stream')
+        shutil.rmtree(stream_dir, ignore_errors=True)
+        logger.info(f"Lendo GBK diretamente para {stream_dir}...")
+        try:
+            export_gbk(gbk_file, stream_dir, self.cancel_event)
+        except GbkFormatError as e:
+            logger.warning(f"Leitura direta não suportada para este GBK ({str(e)}). Usando restauração com gbak")
+            shutil.rmtree(stream_dir, ignore_errors=True)
+            return False
+        except InterruptedError as e:
+            shutil.rmtree(stream_dir, ignore_errors=True)
+            raise StageCancelled(str(e))
+        except Exception:
+            shutil.rmtree(stream_dir, ignore_errors=True)
+            raise
+        self.stream_dir = stream_dir
+        return True
+
+    def remove_stream_dir(self):
+        """Remove os arquivos gerados pela leitura direta do GBK"""
+        if self.stream_dir is None:
+            return
+        shutil.rmtree(self.stream_dir, ignore_errors=True)
+        self.stream_dir = None
+
     def check_nodejs(self):
+        """Verifica o Node.js e instala as dependências uma única vez por processo
+
+        As origens compartilham o diretório do projeto; dois `npm install`
+        simultâneos corromperiam o node_modules e o package-lock.json.
+        """
+        global _npm_path
+        with _npm_lock:
+            if _npm_path is None:
+                _npm_path = self.install_node_dependencies()
+            return _npm_path
+
+    def install_node_dependencies(self):
         """Verifica se o Node.js está instalado e instala as dependências"""
         try:
             # Verifica versão do Node.js e pega o caminho
@@ -272,38 +478,60 @@ class FirebirdMigration:
             logger.error(f"Erro ao verificar Node.js: {str(e)}")
             raise
 
-    def run_migration(self):
+    def migration_env(self, gbk_file=None):
+        """Monta as variáveis de ambiente da migração para esta origem"""
+        env = os.environ.copy()
+        env['MIGRATION_DATABASE'] = self.db_path
+        # Com leitura direta do GBK a migração lê os arquivos em vez do banco
+        if self.stream_dir:
+            env['MIGRATION_INPUT_DIR'] = self.stream_dir
+        # Informa à migração qual GBK originou o banco (usado no manifest do snapshot)
+        if gbk_file:
+            env['MIGRATION_SOURCE_GBK'] = os.path.abspath(gbk_file)
+        if self.mongo_uri:
+            env['MONGO_URI'] = self.mongo_uri
+        if self.mongo_db:
+            env['MONGO_DB_NAME'] = self.mongo_db
+        if self.export_dir:
+            env['EXPORT_DIR'] = self.export_dir
+        if self.batch_state_file:
+            env['BATCH_STATE_FILE'] = self.batch_state_file
+        if self.index_state_file:
+            env['BULK_INDEX_FILE'] = self.index_state_file
+        # Contagens da carga e resultado da verificação, por origem (fora da camada de scratch)
+        os.makedirs(self.default_database_dir, exist_ok=True)
+        env['MIGRATION_REPORT'] = self.migration_report_file()
+        env['VERIFY_REPORT'] = self.verify_report_file()
+        if self.limits is not None:
+            env['MONGO_MAX_POOL_SIZE'] = str(self.limits.mongo_pool_size)
+        return env
+
+    def migration_report_file(self):
+        """Relatório com as contagens de cada tabela gravado pela migração"""
+        return os.path.join(self.default_database_dir, 'migration_report.json')
+
+    def verify_report_file(self):
+        """Resultado da verificação por amostragem"""
+        return os.path.join(self.default_database_dir, 'verify_report.json')
+
+    def run_migration(self, gbk_file=None):
         """Executa o comando npm run migrate"""
         try:
             # Verifica Node.js e instala dependências
             npm_path = self.check_nodejs()
+            self.npm_path = npm_path
             
-            logger.info("Iniciando migração...")
-            
-            # Executa npm run migrate usando o caminho completo do npm
-            process = subprocess.Popen(
-                [npm_path, 'run', 'migrate'],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                encoding='utf-8',
-                bufsize=1
-            )
-
-            # Cria threads para ler stdout e stderr
-            stdout_thread = threading.Thread(target=read_output, args=(process.stdout, logger.info))
-            stderr_thread = threading.Thread(target=read_output, args=(process.stderr, logger.error))
+            # Remove o relatório de uma execução anterior
+            if os.path.exists(self.migration_report_file()):
+                os.remove(self.migration_report_file())
             
-            # Inicia as threads
-            stdout_thread.start()
-            stderr_thread.start()
+            logger.info("Iniciando migração...")
             
-            # Aguarda o processo terminar
-            returncode = process.wait()
+            env = self.migration_env(gbk_file)
             
-            # Aguarda as threads terminarem
-            stdout_thread.join()
-            stderr_thread.join()
+            # Executa npm run migrate usando o caminho completo do npm
+            supervisor = StageSupervisor('migração', MIGRATION_PROGRESS, self.cancel_event)
+            returncode = supervisor.run([npm_path, 'run', 'migrate'], encoding='utf-8', env=env)
 
             if returncode != 0:
                 raise Exception(f"Erro na migração. Código de retorno: {returncode}")
@@ -314,6 +542,39 @@ class FirebirdMigration:
             logger.error(f"Erro durante a migração: {str(e)}")
             raise
 
+    def run_verification(self, gbk_file=None):
+        """Confere contagens e uma amostra de registros entre o Firebird e o MongoDB
+
+        Lança exceção se alguma tabela divergir, impedindo que o GBK seja
+        marcado como processado.
+        """
+        npm_path = self.npm_path or self.check_nodejs()
+        report_file = self.verify_report_file()
+        if os.path.exists(report_file):
+            os.remove(report_file)
+
+        logger.info("Iniciando verificação da migração...")
+        supervisor = StageSupervisor('verificação', None, self.cancel_event)
+        returncode = supervisor.run([npm_path, 'run', 'verify'], encoding='utf-8', env=self.migration_env(gbk_file))
+        if returncode != 0:
+            raise Exception(f"Erro na verificação. Código de retorno: {returncode}")
+
+        with open(report_file, 'r', encoding='utf-8') as f:
+            report = json.load(f)
+
+        failed = [table['table'] for table in report['tables'] if not table['passed']]
+        self.metrics['verification'] = {
+            'passed': report['passed'],
+            'tables': len(report['tables']),
+            'sampled_rows': sum(table['sampledRows'] for table in report['tables']),
+            'failed_tables': failed,
+            'seconds': report['seconds']
+        }
+
+        if not report['passed']:
+            raise Exception(f"Verificação reprovada nas tabelas: {', '.join(failed)}")
+        logger.info("Verificação aprovada!")
+
     def cleanup_old_backups(self):
         """Remove backups mais antigos que X dias conforme configuração do .env"""
         try:
@@ -356,7 +617,9 @@ class FirebirdMigration:
             logger.info("Iniciando processo de automação...")
             
             # Tenta preparar novo backup primeiro
-            if not prepare_backup():
+            with self._slot('io_slot'):
+                prepared = prepare_backup(self.gbk_path, self.gbk_dir)
+            if not prepared:
                 logger.info("Nenhum backup novo para preparar")
                 return True
             
@@ -372,27 +635,68 @@ class FirebirdMigration:
             
             # Registra o arquivo que será processado
             logger.info(f"Arquivo GBK mais recente encontrado: {latest_gbk}")
+            self.metrics = {
+                'source': self.name,
+                'gbk': gbk_filename,
+                'gbk_size': os.path.getsize(latest_gbk),
+                'started_at': datetime.now().isoformat(timespec='seconds')
+            }
+            
+            # Escolhe onde restaurar o banco (tmpfs/RAM disk, disco rápido ou padrão)
+            self.select_scratch_tier(latest_gbk)
+            
+            with self._slot('io_slot'):
+                # Leitura direta do GBK, sem gbak nem Firebird (GBK_DIRECT_READ)
+                direct = False
+                if os.getenv('GBK_DIRECT_READ', 'false').lower() == 'true':
+                    started = time.time()
+                    direct = self.read_gbk_directly(latest_gbk)
+                    self.metrics['convert_seconds'] = round(time.time() - started, 1)
+                self.metrics['read_mode'] = 'direct' if direct else 'restore'
+
+                # Remove banco existente e restaura o banco (disco intensivo)
+                if not direct:
+                    self.remove_existing_db()
+                    started = time.time()
+                    self.run_stage('restore', self.restore_database, latest_gbk)
+                    self.metrics['restore_seconds'] = round(time.time() - started, 1)
+            
+            # Executa a migração (limitada pelas conexões do MongoDB)
+            with self._slot('migration_slot'):
+                started = time.time()
+                self.run_stage('migration', self.run_migration, latest_gbk)
+                self.metrics['migration_seconds'] = round(time.time() - started, 1)
+                
+                # Verificação opcional por amostragem (uma falha impede salvar o arquivo de controle)
+                if os.getenv('VERIFY_ENABLED', 'false').lower() == 'true':
+                    self.run_stage('verification', self.run_verification, latest_gbk)
             
-            # Remove banco existente
-            self.remove_existing_db()
-            
-            # Restaura o banco
-            self.restore_database(latest_gbk)
-            
-            # Executa a migração
-            self.run_migration()
-            
-            # Salva o arquivo processado
+            # Salva o arquivo processado. Com BULK_LOAD=true a migração só termina
+            # depois de recriar os índices e gravar o checkpoint durável no MongoDB
             self.save_last_processed_gbk(latest_gbk)
             
             # Limpa backups antigos
             self.cleanup_old_backups()
             
+            self.metrics['status'] = 'success'
             return False  # Retorna False quando processou um arquivo
             
+        except StageCancelled as e:
+            logger.warning(f"Processo cancelado: {str(e)}")
+            if self.metrics:
+                self.metrics['status'] = 'cancelled'
+            return None
         except Exception as e:
             logger.error(f"Erro durante o processo: {str(e)}")
+            if self.metrics:
+                self.metrics['status'] = 'error'
+                self.metrics['error'] = str(e)
             sys.exit(1)
+        finally:
+            # Libera a camada de scratch e registra as métricas da execução
+            self.remove_stream_dir()
+            self.release_scratch()
+            self.save_run_metrics()
 
 if __name__ == "__main__":
     migration = FirebirdMigration()
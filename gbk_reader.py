@@ -0,0 +1,768 @@
+import os
+import re
+import sys
+import gzip
+import json
+import base64
+import struct
+import hashlib
+import logging
+from datetime import date, datetime, timedelta, timezone
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+# Tipos de registro do formato de backup do gbak (burp.h)
+REC_BURP = 1
+REC_DATABASE = 2
+REC_GLOBAL_FIELD = 3
+REC_RELATION = 4
+REC_FIELD = 5
+REC_INDEX = 6
+REC_DATA = 7
+REC_BLOB = 8
+REC_RELATION_DATA = 9
+REC_RELATION_END = 10
+REC_END = 11
+REC_VIEW = 12
+REC_ARRAY = 24
+
+ATT_END = 0
+
+# Atributos do cabeçalho do backup
+ATT_BACKUP_FORMAT = 2
+ATT_BACKUP_COMPRESS = 4
+ATT_BACKUP_TRANSPORTABLE = 5
+ATT_BACKUP_ZIP = 10
+ATT_BACKUP_CRYPT = 12
+
+# Atributos do banco e das relações gravados como blob (BLR, fonte, descrição)
+DATABASE_BLOB_ATTRS = {6, 10}
+ATT_RELATION_NAME = 1
+ATT_RELATION_VIEW_BLR = 2
+ATT_RELATION_SYSTEM_FLAG = 7
+RELATION_BLOB_ATTRS = {2, 3, 9, 11, 13, 14, 15}
+
+# Atributos de campo (domínios e campos locais)
+ATT_FIELD_NAME = 1
+ATT_FIELD_SOURCE = 2
+ATT_FIELD_TYPE = 9
+ATT_FIELD_LENGTH = 10
+ATT_FIELD_SUB_TYPE = 11
+ATT_FIELD_SCALE = 12
+ATT_FIELD_POSITION = 14
+ATT_FIELD_OFFSET = 15
+ATT_FIELD_COMPUTED_BLR = 19
+ATT_FIELD_NUMBER = 21
+ATT_FIELD_DIMENSIONS = 22
+FIELD_BLOB_ATTRS = {5, 7, 16, 17, 18, 19, 24, 25, 26, 27}
+MAX_FIELD_ATTR = 60
+
+# Atributos dos registros de dados e de blob
+ATT_DATA_LENGTH = 1
+ATT_DATA_DATA = 2
+ATT_XDR_LENGTH = 3
+ATT_BLOB_FIELD_NUMBER = 1
+ATT_BLOB_NUMBER_SEGMENTS = 3
+ATT_BLOB_DATA = 5
+
+# Atributos de índice gravados como blob (descrição, expressão e condição)
+INDEX_BLOB_ATTRS = {6, 9, 10, 11, 12, 13}
+
+# Tipos de campo (RDB$FIELD_TYPE)
+T_SHORT = 7
+T_LONG = 8
+T_QUAD = 9
+T_FLOAT = 10
+T_D_FLOAT = 11
+T_DATE = 12
+T_TIME = 13
+T_TEXT = 14
+T_INT64 = 16
+T_BOOLEAN = 23
+T_DOUBLE = 27
+T_TIMESTAMP = 35
+T_VARYING = 37
+T_BLOB_ID = 45
+T_BLOB = 261
+
+# Maior blob de metadados aceito ao validar um registro
+MAX_METADATA_BLOB = 16 * 1024 * 1024
+
+# Início de um registro reconhecível: domínio, relação ou dados de uma relação
+RECORD_START = re.compile(rb'[\x03\x04\x09]\x01([\x01-\x3f])')
+NAME_BYTES = re.compile(rb'[\x21-\x7e][\x20-\x7e]*')
+
+# Datas do Firebird contam dias a partir de 17/11/1858; horas em 1/10000 s
+FB_EPOCH = date(1858, 11, 17)
+UNIX_EPOCH = date(1970, 1, 1)
+
+
+class GbkFormatError(Exception):
+    """O arquivo não pôde ser lido como backup do gbak"""
+
+
+class _Mismatch(Exception):
+    """O registro lido não tem a estrutura esperada (usado para ressincronizar)"""
+
+    def __init__(self, attrs=None):
+        super().__init__()
+        self.attrs = attrs or {}
+
+
+class _Stream:
+    """Leitura bufferizada do arquivo com retrocesso até a marca atual"""
+
+    CHUNK = 4 * 1024 * 1024
+
+    def __init__(self, fileobj):
+        self.file = fileobj
+        self.buf = bytearray()
+        self.pos = 0
+        self.offset = 0  # Posição no arquivo de buf[0]
+        self.mark = None  # Posição absoluta que precisa continuar no buffer
+        self.eof = False
+
+    def _fill(self, n):
+        """Garante n bytes disponíveis a partir da posição atual"""
+        while len(self.buf) - self.pos < n and not self.eof:
+            keep = self.pos if self.mark is None else self.mark - self.offset
+            if keep > self.CHUNK:
+                del self.buf[:keep]
+                self.offset += keep
+                self.pos -= keep
+            chunk = self.file.read(max(self.CHUNK, n))
+            if not chunk:
+                self.eof = True
+                break
+            self.buf += chunk
+        return len(self.buf) - self.pos >= n
+
+    def tell(self):
+        return self.offset + self.pos
+
+    def seek(self, position):
+        """Volta para uma posição ainda presente no buffer"""
+        if not self.offset <= position <= self.offset + len(self.buf):
+            raise GbkFormatError("Retrocesso fora do buffer")
+        self.pos = position - self.offset
+
+    def at_eof(self):
+        return not self._fill(1)
+
+    def byte(self):
+        if not self._fill(1):
+            raise GbkFormatError("Fim inesperado do arquivo")
+        value = self.buf[self.pos]
+        self.pos += 1
+        return value
+
+    def read(self, n):
+        if not self._fill(n):
+            raise GbkFormatError("Fim inesperado do arquivo")
+        data = bytes(self.buf[self.pos:self.pos + n])
+        self.pos += n
+        return data
+
+    def read_compressed(self, length):
+        """Descompacta um registro gravado com a compressão RLE do gbak"""
+        # Folga para os bytes de controle (a compressão nunca dobra o tamanho)
+        self._fill(2 * length + 16)
+        buf, i = self.buf, self.pos
+        out = bytearray()
+        try:
+            while len(out) < length:
+                control = buf[i]
+                i += 1
+                if control < 128:
+                    out += buf[i:i + control]
+                    i += control
+                else:
+                    out += bytes((buf[i],)) * (256 - control)
+                    i += 1
+        except IndexError:
+            raise GbkFormatError("Registro de dados truncado")
+        if len(out) != length:
+            raise GbkFormatError("Tamanho do registro descompactado não confere")
+        self.pos = i
+        return bytes(out)
+
+    def scan(self):
+        """Avança até o próximo início de registro reconhecível; False no fim do arquivo"""
+        while True:
+            match = RECORD_START.search(self.buf, self.pos)
+            while match is not None:
+                end = match.end() + match.group(1)[0]
+                if end > len(self.buf):
+                    break
+                if NAME_BYTES.fullmatch(self.buf, match.end(), end):
+                    self.pos = match.start()
+                    return True
+                match = RECORD_START.search(self.buf, match.start() + 1)
+
+            # Mantém no buffer o trecho final, que pode ser o começo de um registro
+            if match is not None:
+                self.pos = match.start()
+            else:
+                self.pos = max(self.pos, len(self.buf) - 2)
+            if not self._fill(len(self.buf) - self.pos + 1):
+                self.pos = len(self.buf)
+                return False
+
+
+class Field:
+    """Definição de um campo de relação, combinando o campo local e seu domínio"""
+
+    def __init__(self, attrs, domain=None):
+        merged = dict(domain or {})
+        merged.update(attrs)
+        self.name = _text(merged[ATT_FIELD_NAME])
+        self.type = _number(merged.get(ATT_FIELD_TYPE))
+        self.length = _number(merged.get(ATT_FIELD_LENGTH)) or 0
+        self.sub_type = _number(merged.get(ATT_FIELD_SUB_TYPE)) or 0
+        self.scale = _number(merged.get(ATT_FIELD_SCALE)) or 0
+        self.position = _number(merged.get(ATT_FIELD_POSITION))
+        self.offset = _number(attrs.get(ATT_FIELD_OFFSET))
+        self.number = _number(merged.get(ATT_FIELD_NUMBER))
+        self.computed = ATT_FIELD_COMPUTED_BLR in merged
+        self.array = bool(_number(merged.get(ATT_FIELD_DIMENSIONS)))
+
+
+class Relation:
+    """Relação (tabela ou view) descrita no backup"""
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.view = ATT_RELATION_VIEW_BLR in attrs
+        self.system = bool(_number(attrs.get(ATT_RELATION_SYSTEM_FLAG)))
+        self.fields = []
+
+    @property
+    def is_table(self):
+        return not self.view and not self.system
+
+
+def _number(value):
+    """Converte um atributo numérico (inteiro little-endian de tamanho variável)"""
+    if value is None or value is True:
+        return None
+    return int.from_bytes(value, 'little', signed=True) if value else 0
+
+
+def _text(value):
+    return value.decode('latin1').strip()
+
+
+def _pad4(n):
+    return (n + 3) & ~3
+
+
+class _RecordDecoder:
+    """Converte o buffer de um registro de dados em um dicionário"""
+
+    def __init__(self, relation, transportable, charset):
+        self.charset = charset
+        self.transportable = transportable
+        fields = [f for f in relation.fields if not f.computed]
+        for field in fields:
+            if field.type is None:
+                raise GbkFormatError(f"Tipo desconhecido para {relation.name}.{field.name}")
+            if field.array:
+                raise GbkFormatError(f"Campos array não são suportados ({relation.name}.{field.name})")
+
+        # O buffer segue a ordem dos offsets gravados pelo backup
+        if all(f.offset is not None for f in fields):
+            fields.sort(key=lambda f: f.offset)
+        elif not transportable:
+            raise GbkFormatError(f"Backup não transportável sem offsets de campos ({relation.name})")
+        self.fields = fields
+
+        # Chaves do documento na ordem das colunas da tabela. Campos BLOB ficam de fora,
+        # como na migração pelo Firebird: o node-firebird os entrega como funções de
+        # leitura, que não são gravadas no MongoDB
+        self.blob_fields = {f.number: f for f in fields if f.type in (T_BLOB, T_QUAD, T_BLOB_ID)}
+        self.names = [f.name for f in sorted(fields, key=lambda f: (f.position is None, f.position or 0))
+                      if f.number not in self.blob_fields]
+
+    def decode(self, raw):
+        try:
+            if self.transportable:
+                values, nulls = self._decode_xdr(raw)
+            else:
+                values, nulls = self._decode_native(raw)
+        except (struct.error, IndexError):
+            raise GbkFormatError("Registro de dados menor que a definição da tabela")
+
+        row = {}
+        for field, value, null in zip(self.fields, values, nulls):
+            row[field.name] = None if null else self._convert(field, value)
+        return {name: row[name] for name in self.names}
+
+    def _decode_xdr(self, raw):
+        values = []
+        pos = 0
+        for field in self.fields:
+            t = field.type
+            if t == T_TEXT:
+                values.append(raw[pos:pos + field.length])
+                pos += _pad4(field.length)
+            elif t == T_VARYING:
+                (n,) = struct.unpack_from('>i', raw, pos)
+                values.append(raw[pos + 4:pos + 4 + n])
+                pos += 4 + _pad4(n)
+            elif t in (T_SHORT, T_LONG, T_DATE):
+                values.append(struct.unpack_from('>i', raw, pos)[0])
+                pos += 4
+            elif t == T_TIME:
+                values.append(struct.unpack_from('>I', raw, pos)[0])
+                pos += 4
+            elif t == T_FLOAT:
+                values.append(struct.unpack_from('>f', raw, pos)[0])
+                pos += 4
+            elif t in (T_DOUBLE, T_D_FLOAT):
+                values.append(struct.unpack_from('>d', raw, pos)[0])
+                pos += 8
+            elif t == T_INT64:
+                values.append(struct.unpack_from('>q', raw, pos)[0])
+                pos += 8
+            elif t == T_TIMESTAMP:
+                values.append(struct.unpack_from('>iI', raw, pos))
+                pos += 8
+            elif t in (T_BLOB, T_QUAD, T_BLOB_ID):
+                values.append(raw[pos:pos + 8])
+                pos += 8
+            elif t == T_BOOLEAN:
+                values.append(raw[pos] != 0)
+                pos += 4
+            else:
+                raise GbkFormatError(f"Tipo de campo não suportado: {t} ({field.name})")
+
+        nulls = [v != 0 for v in struct.unpack_from(f'>{len(self.fields)}i', raw, pos)]
+        return values, nulls
+
+    def _decode_native(self, raw):
+        values = []
+        end = 0
+        for field in self.fields:
+            t, pos = field.type, field.offset
+            if t == T_TEXT:
+                values.append(raw[pos:pos + field.length])
+                size = field.length
+            elif t == T_VARYING:
+                (n,) = struct.unpack_from('<H', raw, pos)
+                values.append(raw[pos + 2:pos + 2 + n])
+                size = field.length + 2
+            elif t == T_SHORT:
+                values.append(struct.unpack_from('<h', raw, pos)[0])
+                size = 2
+            elif t in (T_LONG, T_DATE):
+                values.append(struct.unpack_from('<i', raw, pos)[0])
+                size = 4
+            elif t == T_TIME:
+                values.append(struct.unpack_from('<I', raw, pos)[0])
+                size = 4
+            elif t == T_FLOAT:
+                values.append(struct.unpack_from('<f', raw, pos)[0])
+                size = 4
+            elif t in (T_DOUBLE, T_D_FLOAT):
+                values.append(struct.unpack_from('<d', raw, pos)[0])
+                size = 8
+            elif t == T_INT64:
+                values.append(struct.unpack_from('<q', raw, pos)[0])
+                size = 8
+            elif t == T_TIMESTAMP:
+                values.append(struct.unpack_from('<iI', raw, pos))
+                size = 8
+            elif t in (T_BLOB, T_QUAD, T_BLOB_ID):
+                values.append(raw[pos:pos + 8])
+                size = 8
+            elif t == T_BOOLEAN:
+                values.append(raw[pos] != 0)
+                size = 1
+            else:
+                raise GbkFormatError(f"Tipo de campo não suportado: {t} ({field.name})")
+            end = max(end, pos + size)
+
+        # Indicadores de nulo (SSHORT) logo após os campos, na mesma ordem
+        end = (end + 1) & ~1
+        nulls = [v != 0 for v in struct.unpack_from(f'<{len(self.fields)}h', raw, end)]
+        return values, nulls
+
+    def _convert(self, field, value):
+        t = field.type
+        if t in (T_TEXT, T_VARYING):
+            if field.sub_type == 1:  # OCTETS
+                return value
+            return value.decode(self.charset, errors='replace')
+        if t in (T_SHORT, T_LONG, T_INT64):
+            return round(value / 10 ** -field.scale, -field.scale) if field.scale < 0 else value
+        if t == T_DATE:
+            return datetime.combine(FB_EPOCH + timedelta(days=value), datetime.min.time())
+        if t == T_TIME:
+            # Como o node-firebird: hora local na data 1970-01-01
+            seconds, fraction = divmod(value, 10000)
+            return (datetime.combine(UNIX_EPOCH, datetime.min.time())
+                    + timedelta(seconds=seconds, microseconds=fraction * 100))
+        if t == T_TIMESTAMP:
+            days, ticks = value
+            return (datetime.combine(FB_EPOCH + timedelta(days=days), datetime.min.time())
+                    + timedelta(microseconds=ticks * 100))
+        if t in (T_BLOB, T_QUAD, T_BLOB_ID):
+            # Fora do documento (ver self.names)
+            return None
+        return value
+
+
+class GbkReader:
+    """Lê um backup do gbak (.gbk) em streaming, sem restaurar o banco
+
+    Os metadados necessários (domínios, relações e campos) são interpretados
+    conforme aparecem; registros que o leitor não conhece são pulados procurando
+    o próximo início de domínio, relação ou seção de dados. Como essa busca pode
+    aceitar um início falso, a leitura falha se uma seção de dados não tiver
+    definição ou se alguma tabela ficar sem seção de dados. Os registros de cada
+    tabela são descompactados e convertidos um a um, então a memória usada não
+    depende do tamanho do backup. Qualquer estrutura inesperada dentro dos dados
+    gera GbkFormatError.
+    """
+
+    def __init__(self, fileobj, charset=None):
+        load_dotenv()
+        self.stream = _Stream(fileobj)
+        self.charset = charset or os.getenv('GBK_CHARSET', 'cp1252')
+        self.domains = {}
+        self.relations = {}
+        # Relações cuja definição foi encontrada mas não pôde ser interpretada
+        self.failed_relations = set()
+        # Relações cuja seção de dados já foi lida
+        self.data_sections = set()
+        self.header = self._read_header()
+        self.compressed = bool(_number(self.header.get(ATT_BACKUP_COMPRESS)))
+        self.transportable = bool(_number(self.header.get(ATT_BACKUP_TRANSPORTABLE)))
+        self._needs_scan = False
+
+    def _read_header(self):
+        if self.stream.at_eof() or self.stream.byte() != REC_BURP:
+            raise GbkFormatError("Arquivo não é um backup do gbak")
+        header = {}
+        while True:
+            att = self.stream.byte()
+            if att == ATT_END:
+                break
+            header[att] = self.stream.read(self.stream.byte())
+        if ATT_BACKUP_FORMAT not in header:
+            raise GbkFormatError("Versão do formato de backup não encontrada")
+        if _number(header.get(ATT_BACKUP_ZIP)) or ATT_BACKUP_CRYPT in header:
+            raise GbkFormatError("Backups compactados ou criptografados pelo gbak não são suportados")
+        return header
+
+    def _read_attributes(self, blob_attrs, max_attr=MAX_FIELD_ATTR):
+        """Lê os atributos de um registro de metadados até att_end"""
+        attrs = {}
+        while True:
+            att = self.stream.byte()
+            if att == ATT_END:
+                return attrs
+            if att > max_attr:
+                raise _Mismatch(attrs)
+            if att in blob_attrs:
+                size = _number(self.stream.read(self.stream.byte()))
+                if size < 0 or size > MAX_METADATA_BLOB:
+                    raise _Mismatch(attrs)
+                self.stream.read(size)
+                attrs[att] = True
+            else:
+                attrs[att] = self.stream.read(self.stream.byte())
+
+    def _read_name(self, attrs, att=ATT_FIELD_NAME):
+        name = attrs.get(att)
+        if not name or name is True or not NAME_BYTES.fullmatch(name):
+            raise _Mismatch()
+        return _text(name)
+
+    def _read_global_field(self):
+        attrs = self._read_attributes(FIELD_BLOB_ATTRS)
+        self.domains[self._read_name(attrs)] = attrs
+
+    def _read_relation(self):
+        try:
+            attrs = self._read_attributes(RELATION_BLOB_ATTRS)
+        except _Mismatch as e:
+            self._relation_failed(e.attrs)
+            raise
+        relation = Relation(self._read_name(attrs, ATT_RELATION_NAME), attrs)
+        if relation.name in self.relations:
+            # Uma relação é definida uma única vez: é um falso início achado na ressincronização
+            raise _Mismatch()
+        try:
+            self._read_fields(relation)
+        except _Mismatch:
+            self._relation_failed(attrs)
+            raise
+        self.relations[relation.name] = relation
+        self.failed_relations.discard(relation.name)
+
+    def _relation_failed(self, attrs):
+        try:
+            self.failed_relations.add(self._read_name(attrs, ATT_RELATION_NAME))
+        except _Mismatch:
+            pass
+
+    def _read_fields(self, relation):
+        while True:
+            rec = self.stream.byte()
+            if rec == REC_END:
+                break
+            if rec == REC_FIELD:
+                field_attrs = self._read_attributes(FIELD_BLOB_ATTRS)
+                self._read_name(field_attrs)
+                source = field_attrs.get(ATT_FIELD_SOURCE)
+                domain = self.domains.get(_text(source)) if source and source is not True else None
+                relation.fields.append(Field(field_attrs, domain))
+            elif rec == REC_VIEW:
+                self._read_attributes(set())
+            else:
+                raise _Mismatch()
+
+    def _next_relation_data(self):
+        """Avança até o início da próxima seção de dados; retorna a relação ou None"""
+        # O gbak grava todas as definições antes dos dados: com os dados de todas as
+        # tabelas lidos, o restante do backup (triggers, procedures...) não é necessário
+        if self.data_sections and all(r.name in self.data_sections for r in self.relations.values() if r.is_table):
+            return None
+        while True:
+            if self._needs_scan:
+                self._needs_scan = False
+                if not self.stream.scan():
+                    return None
+            if self.stream.at_eof():
+                return None
+
+            start = self.stream.tell()
+            self.stream.mark = start
+            data_name = None
+            try:
+                rec = self.stream.byte()
+                if rec == REC_GLOBAL_FIELD:
+                    self._read_global_field()
+                    continue
+                if rec == REC_RELATION:
+                    self._read_relation()
+                    continue
+                if rec == REC_DATABASE:
+                    self._read_attributes(DATABASE_BLOB_ATTRS)
+                    continue
+                if rec == REC_RELATION_DATA:
+                    attrs = self._read_attributes(set())
+                    data_name = self._read_name(attrs, ATT_RELATION_NAME)
+                    if data_name in self.relations and data_name not in self.data_sections:
+                        self.data_sections.add(data_name)
+                        return self.relations[data_name]
+                if rec == REC_END and self.stream.at_eof():
+                    return None
+            except (_Mismatch, GbkFormatError):
+                pass
+            finally:
+                self.stream.mark = None
+
+            # Dados de uma relação sem definição lida (ou repetidos): descartá-los perderia registros
+            if data_name is not None:
+                raise GbkFormatError(f"Dados da relação {data_name} sem definição de campos")
+
+            # Registro desconhecido ou inválido: procura o próximo reconhecível
+            self.stream.seek(start + 1)
+            self._needs_scan = True
+
+    def _read_data(self, decoder):
+        lengths = {}
+        while True:
+            att = self.stream.byte()
+            if att == ATT_DATA_DATA:
+                break
+            if att not in (ATT_DATA_LENGTH, ATT_XDR_LENGTH):
+                raise GbkFormatError(f"Atributo inesperado no registro de dados: {att}")
+            lengths[att] = _number(self.stream.read(self.stream.byte()))
+
+        length = lengths.get(ATT_XDR_LENGTH) if self.transportable else None
+        if length is None:
+            length = lengths.get(ATT_DATA_LENGTH)
+        if length is None:
+            raise GbkFormatError("Registro de dados sem tamanho")
+
+        raw = self.stream.read_compressed(length) if self.compressed else self.stream.read(length)
+        return decoder.decode(raw)
+
+    def _read_blob(self, decoder):
+        """Pula o conteúdo de um blob, conferindo que pertence a um campo BLOB da relação"""
+        attrs = {}
+        while True:
+            att = self.stream.byte()
+            if att == ATT_BLOB_DATA:
+                break
+            attrs[att] = _number(self.stream.read(self.stream.byte()))
+
+        for _ in range(attrs.get(ATT_BLOB_NUMBER_SEGMENTS) or 0):
+            (size,) = struct.unpack('<H', self.stream.read(2))
+            self.stream.read(size)
+
+        if attrs.get(ATT_BLOB_FIELD_NUMBER) not in decoder.blob_fields:
+            raise GbkFormatError(f"Blob de campo desconhecido: {attrs.get(ATT_BLOB_FIELD_NUMBER)}")
+
+    def _iter_rows(self, relation):
+        decoder = _RecordDecoder(relation, self.transportable, self.charset)
+        row = None
+        while True:
+            rec = self.stream.byte()
+            if rec == REC_DATA:
+                if row is not None:
+                    yield row
+                row = self._read_data(decoder)
+            elif rec == REC_BLOB:
+                if row is None:
+                    raise GbkFormatError(f"Blob sem registro de dados em {relation.name}")
+                self._read_blob(decoder)
+            elif rec == REC_RELATION_END:
+                break
+            elif rec == REC_INDEX:
+                # O gbak grava os índices da relação junto com os dados
+                try:
+                    self._read_attributes(INDEX_BLOB_ATTRS)
+                except _Mismatch:
+                    raise GbkFormatError(f"Índice não interpretado nos dados de {relation.name}")
+            elif rec == REC_ARRAY:
+                raise GbkFormatError(f"Campos array não são suportados ({relation.name})")
+            else:
+                raise GbkFormatError(f"Registro inesperado ({rec}) nos dados de {relation.name}")
+        if row is not None:
+            yield row
+
+    def iter_tables(self):
+        """Gera (relação, registros) para cada seção de dados do backup
+
+        Os registros de uma relação precisam ser consumidos antes de avançar
+        para a próxima, pois são lidos diretamente do arquivo.
+        """
+        while True:
+            relation = self._next_relation_data()
+            if relation is None:
+                break
+            yield relation, self._iter_rows(relation)
+
+        # Sem a definição não há como saber se a tabela tinha dados no backup
+        if self.failed_relations:
+            names = ', '.join(sorted(self.failed_relations))
+            raise GbkFormatError(f"Definição de relações não interpretada: {names}")
+
+        # O gbak grava uma seção de dados para cada tabela, mesmo vazia. Se faltar,
+        # a ressincronização pulou o início da seção (ou aceitou uma definição falsa)
+        missing = [r.name for r in self.relations.values() if r.is_table and r.name not in self.data_sections]
+        if missing:
+            raise GbkFormatError(f"Seção de dados não encontrada para: {', '.join(sorted(missing))}")
+
+
+class _DigestFile:
+    """Repassa a escrita para o arquivo contando bytes e calculando o SHA-256"""
+
+    def __init__(self, fileobj):
+        self.file = fileobj
+        self.bytes = 0
+        self.hash = hashlib.sha256()
+
+    def write(self, data):
+        self.bytes += len(data)
+        self.hash.update(data)
+        return self.file.write(data)
+
+    def flush(self):
+        self.file.flush()
+
+
+def _json_default(value):
+    """Serializa valores do Firebird no JSON estendido lido pela migração"""
+    if isinstance(value, datetime):
+        # Datas do Firebird não têm fuso; são interpretadas no horário local, como no node-firebird
+        try:
+            value = value.astimezone(timezone.utc)
+        except (OverflowError, OSError, ValueError):
+            value = value.replace(tzinfo=timezone.utc)
+        return {'$date': value.isoformat(timespec='milliseconds').replace('+00:00', 'Z')}
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode('ascii')
+    raise TypeError(f"Tipo não serializável: {type(value).__name__}")
+
+
+def _write_table(output_dir, name, rows, cancel_event=None):
+    """Grava os registros de uma tabela em <tabela>.jsonl.gz e retorna a entrada do manifest"""
+    filename = f"{name.lower()}.jsonl.gz"
+    path = os.path.join(output_dir, filename)
+    count = 0
+    with open(path + '.tmp', 'wb') as raw:
+        digest = _DigestFile(raw)
+        with gzip.GzipFile(filename=filename, fileobj=digest, mode='wb', compresslevel=6) as gz:
+            for row in rows:
+                gz.write(json.dumps(row, default=_json_default, ensure_ascii=False).encode('utf-8') + b'\n')
+                count += 1
+                if count % 10000 == 0 and cancel_event is not None and cancel_event.is_set():
+                    raise InterruptedError(f"Conversão cancelada na tabela {name}")
+    os.replace(path + '.tmp', path)
+    return {'table': name, 'file': filename, 'rows': count, 'bytes': digest.bytes, 'sha256': digest.hash.hexdigest()}
+
+
+def export_gbk(gbk_file, output_dir, cancel_event=None):
+    """Converte um .gbk em arquivos JSONL comprimidos, um por tabela, com manifest.json
+
+    O formato é o mesmo do snapshot gravado pela migração (src/migration/export.ts):
+    JSON estendido, com datas em {"$date": ...}, que a migração carrega no MongoDB.
+    Lança GbkFormatError se o backup não puder ser interpretado e
+    InterruptedError se o cancel_event for sinalizado.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    started_at = datetime.now(timezone.utc)
+    tables = {}
+
+    with open(gbk_file, 'rb') as f:
+        reader = GbkReader(f)
+        for relation, rows in reader.iter_tables():
+            if not relation.is_table:
+                for _ in rows:
+                    pass
+                continue
+            entry = _write_table(output_dir, relation.name, rows, cancel_event)
+            tables[relation.name] = entry
+            logger.info(f"Tabela {relation.name} convertida: {entry['rows']} registros")
+
+    if not tables:
+        raise GbkFormatError("Nenhuma tabela encontrada no backup")
+
+    stats = os.stat(gbk_file)
+    manifest = {
+        'source': {
+            'file': os.path.basename(gbk_file),
+            'size': stats.st_size,
+            'mtime': datetime.fromtimestamp(stats.st_mtime, timezone.utc).isoformat()
+        },
+        'format': 'jsonl.gz',
+        'reader': 'gbk_reader',
+        'startedAt': started_at.isoformat(),
+        'finishedAt': datetime.now(timezone.utc).isoformat(),
+        'tables': sorted(tables.values(), key=lambda t: t['table']),
+        'failures': []
+    }
+    manifest_path = os.path.join(output_dir, 'manifest.json')
+    with open(manifest_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(manifest_path + '.tmp', manifest_path)
+    return manifest
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if len(sys.argv) != 3:
+        print("Uso: python gbk_reader.py <arquivo.gbk> <diretório de saída>")
+        sys.exit(2)
+    try:
+        result = export_gbk(sys.argv[1], sys.argv[2])
+        logger.info(f"{len(result['tables'])} tabelas convertidas")
+    except GbkFormatError as e:
+        logger.error(f"Erro ao ler o backup: {str(e)}")
+        sys.exit(1)
@@ -0,0 +1,140 @@
+import os
+import sys
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dotenv import load_dotenv
+from automacao import FirebirdMigration, logger
+
+# Arquivo com a lista de origens (lojas / instâncias do ERP)
+DEFAULT_SOURCES_FILE = 'sources.json'
+
+
+class SourceLimits:
+    """Limites globais compartilhados por todas as origens"""
+
+    def __init__(self, max_io=1, max_migrations=2, mongo_connections=20):
+        # Etapas de disco (extração do .7z, remoção e restauração do banco)
+        self.io_slot = threading.BoundedSemaphore(max_io)
+        # Etapas de migração (cada uma abre um pool de conexões no MongoDB)
+        self.migration_slot = threading.BoundedSemaphore(max_migrations)
+        # Divide o total de conexões entre as migrações simultâneas
+        self.mongo_pool_size = max(1, mongo_connections // max_migrations)
+
+    @classmethod
+    def from_env(cls):
+        """Lê os limites do .env"""
+        load_dotenv()
+        return cls(
+            max_io=int(os.getenv('MAX_PARALLEL_RESTORES', '1')),
+            max_migrations=int(os.getenv('MAX_PARALLEL_MIGRATIONS', '2')),
+            mongo_connections=int(os.getenv('MONGO_MAX_CONNECTIONS', '20'))
+        )
+
+
+def get_sources_file():
+    """Retorna o caminho do arquivo de origens configurado"""
+    load_dotenv()
+    return os.path.abspath(os.getenv('SOURCES_FILE', DEFAULT_SOURCES_FILE))
+
+
+def load_sources(sources_file=None):
+    """Carrega e valida a lista de origens do arquivo JSON
+
+    Caminhos relativos são resolvidos a partir do diretório do arquivo.
+    Cada origem recebe diretórios próprios de restauração e controle quando
+    eles não são informados, para que as origens nunca compartilhem arquivos.
+    """
+    sources_file = sources_file or get_sources_file()
+    with open(sources_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    entries = data.get('sources', []) if isinstance(data, dict) else data
+    if not entries:
+        raise ValueError(f"Nenhuma origem configurada em {sources_file}")
+
+    base_dir = os.path.dirname(os.path.abspath(sources_file))
+
+    def resolve(path):
+        return path if os.path.isabs(path) else os.path.join(base_dir, path)
+
+    sources = []
+    names = set()
+    for entry in entries:
+        name = entry.get('name')
+        if not name:
+            raise ValueError("Toda origem precisa de um 'name'")
+        if name in names:
+            raise ValueError(f"Origem duplicada: {name}")
+        names.add(name)
+
+        source = dict(entry)
+        source['gbk_dir'] = resolve(entry.get('gbk_dir', os.path.join('gbk', name)))
+        source['database_dir'] = resolve(entry.get('database_dir', os.path.join('firebird', 'restored', name)))
+        source['ledger'] = resolve(entry.get('ledger', f'last_processed_{name}.txt'))
+        source['metrics'] = resolve(entry.get('metrics', f'run_metrics_{name}.jsonl'))
+        source['batch_state'] = resolve(entry.get('batch_state', f'batch_tuning_{name}.json'))
+        source['index_state'] = resolve(entry.get('index_state', f'bulk_indexes_{name}.json'))
+        source['export_dir'] = resolve(entry.get('export_dir', os.path.join('export', name)))
+        sources.append(source)
+
+    return sources
+
+
+def run_source(source, limits, cancel_event=None):
+    """Executa o processo completo de uma origem"""
+    threading.current_thread().name = source['name']
+    migration = FirebirdMigration(source, limits, cancel_event)
+    try:
+        return migration.run()
+    except SystemExit:
+        # FirebirdMigration.run encerra com sys.exit(1) em caso de erro
+        raise Exception(f"Falha ao processar a origem {source['name']}")
+
+
+def run_all_sources(sources=None, limits=None, max_workers=None, cancel_event=None):
+    """Executa todas as origens em um pool limitado de workers
+
+    Retorna True quando nenhuma origem tinha arquivo novo (mesma convenção de
+    FirebirdMigration.run). Se alguma origem falhar, as demais terminam
+    normalmente e uma exceção com o resumo é lançada ao final.
+    """
+    sources = sources if sources is not None else load_sources()
+    limits = limits or SourceLimits.from_env()
+    if max_workers is None:
+        max_workers = int(os.getenv('MAX_PARALLEL_SOURCES', '0')) or max(1, (os.cpu_count() or 2) // 2)
+    max_workers = min(max_workers, len(sources))
+
+    # Inclui o nome da origem (thread) nos logs, já que as saídas se misturam
+    for handler in logging.getLogger().handlers:
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - [%(threadName)s] %(message)s'))
+
+    logger.info(f"Processando {len(sources)} origens com até {max_workers} em paralelo")
+
+    nothing_new = True
+    failures = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(run_source, source, limits, cancel_event): source['name'] for source in sources}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                if future.result() is not True:
+                    nothing_new = False
+                logger.info(f"Origem {name} finalizada")
+            except Exception as e:
+                logger.error(f"Erro na origem {name}: {str(e)}")
+                failures.append(name)
+
+    if failures:
+        raise Exception(f"Falha nas origens: {', '.join(failures)}")
+
+    return nothing_new
+
+
+if __name__ == "__main__":
+    try:
+        run_all_sources()
+    except Exception as e:
+        logger.error(f"Erro durante o processamento das origens: {str(e)}")
+        sys.exit(1)
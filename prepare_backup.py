@@ -50,8 +50,9 @@ def check_if_exists(gbk_dir, gbk_filename):
 def extract_and_move(backup_file, gbk_dir):
     """Extrai o arquivo 7z e move seu conteúdo para o diretório gbk."""
     try:
-        # Criar diretório temporário para extração
-        temp_dir = Path("temp_extract")
+        # Criar diretório temporário para extração (dentro do diretório gbk,
+        # para que origens diferentes não compartilhem a mesma pasta)
+        temp_dir = Path(gbk_dir) / ".temp_extract"
         temp_dir.mkdir(exist_ok=True)
         
         # Extrair arquivo
@@ -76,8 +77,12 @@ def extract_and_move(backup_file, gbk_dir):
             shutil.rmtree(temp_dir)
         return False
 
-def prepare_backup():
-    """Função principal que será chamada pelo automacao.py"""
+def prepare_backup(gbk_path=None, gbk_dir="gbk"):
+    """Função principal que será chamada pelo automacao.py
+
+    gbk_path: diretório de origem dos arquivos .7z (padrão: GBK_PATH do .env)
+    gbk_dir: diretório local onde o .gbk extraído é colocado
+    """
     try:
         logger.info("="*80)
         logger.info("Iniciando preparação do backup")
@@ -85,7 +90,7 @@ def prepare_backup():
         
         # Carregar variáveis de ambiente
         load_dotenv()
-        gbk_path = os.getenv('GBK_PATH')
+        gbk_path = gbk_path or os.getenv('GBK_PATH')
         
         if not gbk_path:
             logger.error("GBK_PATH não encontrado no arquivo .env")
@@ -97,9 +102,9 @@ def prepare_backup():
             return False
             
         # Diretório gbk local
-        local_gbk_dir = Path("gbk")
+        local_gbk_dir = Path(gbk_dir)
         if not local_gbk_dir.exists():
-            local_gbk_dir.mkdir()
+            local_gbk_dir.mkdir(parents=True)
         
         # Verificar se o arquivo já existe
         gbk_filename = get_gbk_filename(latest_backup)
@@ -116,9 +116,9 @@ def update_icon_status(status='normal'):
     except Exception as e:
         logging.error(f"Erro ao atualizar ícone: {str(e)}")
 
-def run_migration():
-    """Executa a migração"""
-    global last_run, next_run, is_error, stop_event
+def run_migration(stop_event):
+    """Executa a migração; stop_event é o evento de parada desta execução do scheduler"""
+    global last_run, next_run, is_error
     try:
         if stop_event.is_set():
             return
@@ -126,17 +126,38 @@ def run_migration():
         logging.info("Iniciando execução da migração")
         update_icon_status('running')
         
-        # Importa o módulo automacao.py dinamicamente
-        spec = importlib.util.spec_from_file_location(
-            "automacao",
-            os.path.join(os.path.dirname(os.path.abspath(__file__)), "automacao.py")
-        )
-        automacao = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(automacao)
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+        sources_file = os.path.join(base_dir, os.getenv('SOURCES_FILE', 'sources.json'))
         
-        # Cria e executa a migração
-        migration = automacao.FirebirdMigration()
-        result = migration.run()
+        if os.path.exists(sources_file):
+            # Várias origens configuradas: executa todas com o pool do multi_source.py
+            spec = importlib.util.spec_from_file_location(
+                "multi_source",
+                os.path.join(base_dir, "multi_source.py")
+            )
+            multi_source = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(multi_source)
+            
+            result = multi_source.run_all_sources(
+                multi_source.load_sources(sources_file),
+                cancel_event=stop_event
+            )
+        else:
+            # Importa o módulo automacao.py dinamicamente
+            spec = importlib.util.spec_from_file_location(
+                "automacao",
+                os.path.join(base_dir, "automacao.py")
+            )
+            automacao = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(automacao)
+            
+            # Cria e executa a migração
+            migration = automacao.FirebirdMigration(cancel_event=stop_event)
+            result = migration.run()
+        
+        if stop_event.is_set():
+            logging.info("Execução interrompida pelo pedido de parada")
+            return
         
         last_run = datetime.now()
         next_run = datetime.fromtimestamp(time.time() + (current_interval * 60))
@@ -154,13 +175,22 @@ def run_migration():
         is_error = True
         update_icon_status('error')
 
-def migration_loop():
-    """Loop principal de migração"""
-    global running, migration_thread, stop_event, current_interval
+def migration_loop(stop_event, previous=None):
+    """Loop principal de migração
+
+    previous é a thread de uma execução anterior que ainda pode estar finalizando
+    após o timeout de parada; o loop só começa depois que ela terminar.
+    """
+    global running, current_interval
+    
+    if previous is not None and previous.is_alive():
+        logging.info("Aguardando a execução anterior finalizar...")
+        while previous.is_alive() and not stop_event.is_set():
+            previous.join(timeout=1)
     
     while running and not stop_event.is_set():
         try:
-            run_migration()
+            run_migration(stop_event)
             interval = current_interval * 60  # Converte minutos para segundos
             # Divide o sleep em intervalos menores para responder mais rápido ao stop
             for _ in range(interval):
@@ -175,20 +205,18 @@ def migration_loop():
                     break
                 time.sleep(1)
 
-def force_kill_python():
-    """Força o encerramento de processos Python relacionados"""
-    try:
-        os.system('taskkill /F /IM python.exe')
-    except:
-        pass
+# Tempo máximo de espera pelo cancelamento da etapa em andamento (segundos)
+STOP_TIMEOUT = int(os.getenv('SCHEDULER_STOP_TIMEOUT', '60'))
 
 def on_start(icon, item):
     """Inicia a migração"""
     global running, migration_thread, stop_event
     if not running:
-        stop_event.clear()
+        # Cada início tem seu próprio evento: o da execução anterior continua sinalizado
+        # enquanto ela finaliza, e o novo loop espera a thread anterior terminar
+        stop_event = threading.Event()
         running = True
-        migration_thread = threading.Thread(target=migration_loop)
+        migration_thread = threading.Thread(target=migration_loop, args=(stop_event, migration_thread))
         migration_thread.daemon = True
         migration_thread.start()
         logging.info("Scheduler iniciado")
@@ -202,11 +230,11 @@ def on_stop(icon, item):
         running = False
         stop_event.set()
         
+        # A execução em andamento observa o stop_event e encerra apenas seus próprios processos
         if migration_thread and migration_thread.is_alive():
-            migration_thread.join(timeout=5)
+            migration_thread.join(timeout=STOP_TIMEOUT)
             if migration_thread.is_alive():
-                logging.warning("Thread não finalizou no timeout - forçando parada")
-                force_kill_python()
+                logging.warning("Execução ainda finalizando após o timeout de parada")
         
         logging.info("Scheduler parado")
         update_icon_status('normal')
@@ -226,9 +254,7 @@ def on_exit(icon, item):
         stop_event.set()
         
         if migration_thread and migration_thread.is_alive():
-            migration_thread.join(timeout=5)
-            if migration_thread.is_alive():
-                force_kill_python()
+            migration_thread.join(timeout=STOP_TIMEOUT)
         
         icon.stop()
     except Exception as e:
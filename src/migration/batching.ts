@@ -0,0 +1,145 @@
+import fs from 'fs';
+import { BSON } from 'mongodb';
+import { mongoConfig, batchingConfig } from './config';
+
+// Medidas guardadas entre execuções para cada tabela
+interface TableBatchState {
+    rowBytes: number;
+    msPerRow: number;
+    readSize: number;
+    insertSize: number;
+    updatedAt: string;
+}
+
+type BatchState = Record<string, TableBatchState>;
+
+// Quantas linhas de cada lote são medidas para estimar o tamanho médio em BSON
+const SAMPLE_ROWS = 100;
+// Peso da medição mais recente na média móvel
+const SMOOTHING = 0.3;
+// Variação relativa mínima para trocar o tamanho de um lote. Evita reajustar (e registrar
+// no log) a cada lote: cada linha de log reinicia a janela de vazão do supervisor
+const RESIZE_THRESHOLD = 0.2;
+
+function clamp(value: number): number {
+    return Math.max(batchingConfig.minRows, Math.min(batchingConfig.maxRows, Math.floor(value)));
+}
+
+function changed(current: number, next: number): boolean {
+    return Math.abs(next - current) > current * RESIZE_THRESHOLD;
+}
+
+function average(previous: number, current: number): number {
+    return previous > 0 ? previous * (1 - SMOOTHING) + current * SMOOTHING : current;
+}
+
+// Tamanho médio das linhas em BSON, medido numa amostra espaçada do lote
+export function measureRowBytes(rows: any[]): number {
+    if (rows.length === 0) return 0;
+    const step = Math.max(1, Math.floor(rows.length / SAMPLE_ROWS));
+    let bytes = 0;
+    let sampled = 0;
+    for (let i = 0; i < rows.length; i += step) {
+        bytes += BSON.calculateObjectSize(rows[i]);
+        sampled++;
+    }
+    return bytes / sampled;
+}
+
+// Ajusta os lotes de leitura e de inserção de uma tabela a partir do tamanho
+// médio das linhas e da latência medidos nos primeiros lotes.
+// O lote de leitura é limitado pelo orçamento de memória e pela latência alvo;
+// o de inserção, pelo orçamento de bytes de cada insertMany.
+export class BatchTuner {
+    readSize: number;
+    insertSize: number;
+    private rowBytes = 0;
+    private msPerRow = 0;
+
+    constructor(readonly table: string, previous?: TableBatchState) {
+        const large = mongoConfig.largeTables.includes(table);
+        this.readSize = large ? mongoConfig.largeTableBatchSize : mongoConfig.batchSize;
+        this.insertSize = Math.min(1000, this.readSize);
+
+        // Parte dos valores ajustados na última execução, se houver
+        if (batchingConfig.adaptive && previous) {
+            this.rowBytes = previous.rowBytes;
+            this.msPerRow = previous.msPerRow;
+            this.readSize = previous.readSize;
+            this.insertSize = previous.insertSize;
+        }
+    }
+
+    // Registra um lote processado e recalcula os tamanhos
+    observe(rowBytes: number, rows: number, elapsedMs: number) {
+        if (!batchingConfig.adaptive || rows === 0) return;
+
+        this.rowBytes = average(this.rowBytes, rowBytes);
+        this.msPerRow = average(this.msPerRow, elapsedMs / rows);
+
+        let readSize = batchingConfig.readTargetBytes / this.rowBytes;
+        if (this.msPerRow > 0) {
+            readSize = Math.min(readSize, batchingConfig.targetMs / this.msPerRow);
+        }
+        readSize = clamp(readSize);
+        const insertSize = Math.max(1, Math.min(readSize, Math.floor(batchingConfig.insertTargetBytes / this.rowBytes)));
+
+        const resized = changed(this.readSize, readSize);
+        if (resized) {
+            this.readSize = readSize;
+        }
+        if (changed(this.insertSize, insertSize)) {
+            this.insertSize = insertSize;
+        }
+        this.insertSize = Math.min(this.insertSize, this.readSize);
+
+        if (resized) {
+            console.log(`Lote de ${this.table} ajustado para ${this.readSize} registros (inserção: ${this.insertSize}, ~${Math.round(this.rowBytes)} bytes/registro)`);
+        }
+    }
+
+    // Chamado quando o MongoDB rejeita o lote por tamanho (BSONObjectTooLarge)
+    shrink() {
+        this.readSize = Math.max(batchingConfig.minRows, Math.floor(this.readSize / 2));
+        this.insertSize = Math.max(1, Math.min(Math.floor(this.insertSize / 2), this.readSize));
+    }
+
+    state(): TableBatchState {
+        return {
+            rowBytes: Math.round(this.rowBytes),
+            msPerRow: Number(this.msPerRow.toFixed(4)),
+            readSize: this.readSize,
+            insertSize: this.insertSize,
+            updatedAt: new Date().toISOString()
+        };
+    }
+}
+
+// Guarda os tamanhos ajustados de todas as tabelas no arquivo BATCH_STATE_FILE
+export class BatchTuning {
+    private readonly state: BatchState = {};
+
+    constructor(private readonly file: string) {
+        try {
+            if (fs.existsSync(file)) {
+                this.state = JSON.parse(fs.readFileSync(file, 'utf-8'));
+            }
+        } catch (error) {
+            console.warn(`Não foi possível ler ${file}; os lotes serão ajustados do zero:`, error);
+        }
+    }
+
+    tunerFor(table: string): BatchTuner {
+        return new BatchTuner(table, this.state[table]);
+    }
+
+    record(tuner: BatchTuner) {
+        this.state[tuner.table] = tuner.state();
+    }
+
+    async save(): Promise<void> {
+        if (!batchingConfig.adaptive) return;
+        await fs.promises.writeFile(`${this.file}.tmp`, JSON.stringify(this.state, null, 2), 'utf-8');
+        await fs.promises.rename(`${this.file}.tmp`, this.file);
+    }
+}
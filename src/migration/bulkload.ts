@@ -0,0 +1,122 @@
+import fs from 'fs';
+import { bulkLoadConfig, migrationConfig } from './config';
+
+// Índice da chave primária criado pela migração após cada carga (usado pela verificação).
+// Fica fora do registro do perfil de carga em massa, pois é recriado a cada tabela
+export const KEY_INDEX_NAME = 'migration_key';
+
+// Índices secundários de cada collection (chave: "<banco>.<collection>"),
+// guardados em arquivo até serem recriados
+type IndexState = Record<string, any[]>;
+
+// Opções de escrita do perfil de carga em massa: sem journal nem confirmação da maioria
+// por lote; a durabilidade é garantida de uma vez por writeCheckpoint ao final
+export function insertOptions(): any {
+    if (!bulkLoadConfig.enabled) {
+        return { ordered: false };
+    }
+    return {
+        ordered: false,
+        bypassDocumentValidation: true,
+        writeConcern: { w: 1, j: false }
+    };
+}
+
+// Remove os índices secundários antes da carga e os recria uma única vez no final.
+// O arquivo BULK_INDEX_FILE guarda as definições enquanto os índices não existem,
+// então uma execução interrompida recria os índices na próxima.
+export class IndexRegistry {
+    private state: IndexState = {};
+
+    constructor(private readonly file: string) {
+        try {
+            if (fs.existsSync(file)) {
+                this.state = JSON.parse(fs.readFileSync(file, 'utf-8'));
+            }
+        } catch (error) {
+            console.warn(`Não foi possível ler ${file}:`, error);
+        }
+    }
+
+    private save() {
+        fs.writeFileSync(`${this.file}.tmp`, JSON.stringify(this.state, null, 2), 'utf-8');
+        fs.renameSync(`${this.file}.tmp`, this.file);
+    }
+
+    // Registra e remove os índices secundários da collection
+    async dropSecondaryIndexes(mongoDb: any, collectionName: string): Promise<void> {
+        const collection = mongoDb.collection(collectionName);
+        const stateKey = `${mongoDb.databaseName}.${collectionName}`;
+
+        let indexes: any[] = [];
+        try {
+            indexes = await collection.indexes();
+        } catch (error: any) {
+            if (error.codeName !== 'NamespaceNotFound') throw error;
+        }
+
+        const secondary = indexes
+            .filter(index => index.name !== '_id_' && index.name !== KEY_INDEX_NAME)
+            .map(({ v, ns, ...spec }) => spec);
+        if (indexes.every(index => index.name === '_id_')) return;
+
+        if (secondary.length > 0) {
+            // Mantém definições pendentes de uma execução anterior que não chegou a recriá-las
+            const pending = this.state[stateKey] || [];
+            const names = new Set(pending.map(index => index.name));
+            this.state[stateKey] = [...pending, ...secondary.filter(index => !names.has(index.name))];
+            this.save();
+        }
+
+        await collection.dropIndexes();
+        if (secondary.length > 0) {
+            console.log(`Índices removidos de ${collectionName} para a carga: ${secondary.map(index => index.name).join(', ')}`);
+        }
+    }
+
+    // Recria os índices registrados, com até BULK_INDEX_PARALLELISM collections ao mesmo tempo
+    async rebuildIndexes(mongoDb: any): Promise<void> {
+        const prefix = `${mongoDb.databaseName}.`;
+        const pending = Object.keys(this.state).filter(key => key.startsWith(prefix));
+        if (pending.length === 0) return;
+
+        console.log(`\nRecriando índices de ${pending.length} collections...`);
+        const failures: string[] = [];
+        const worker = async () => {
+            let stateKey: string | undefined;
+            while ((stateKey = pending.shift()) !== undefined) {
+                const collectionName = stateKey.slice(prefix.length);
+                const started = Date.now();
+                try {
+                    await mongoDb.collection(collectionName).createIndexes(this.state[stateKey]);
+                    delete this.state[stateKey];
+                    this.save();
+                    console.log(`Índices de ${collectionName} recriados em ${((Date.now() - started) / 1000).toFixed(1)}s`);
+                } catch (error) {
+                    console.error(`❌ Erro ao recriar índices de ${collectionName}:`, error);
+                    failures.push(collectionName);
+                }
+            }
+        };
+        await Promise.all(Array.from({ length: Math.max(1, bulkLoadConfig.indexParallelism) }, worker));
+
+        if (failures.length > 0) {
+            throw new Error(`Falha ao recriar índices de: ${failures.join(', ')}`);
+        }
+    }
+}
+
+// Grava um registro com journal e confirmação da maioria. Como o journal é
+// sequencial, a confirmação garante que todas as inserções anteriores estão
+// duráveis; só depois disso o automacao.py marca o GBK como processado.
+export async function writeCheckpoint(mongoDb: any): Promise<void> {
+    await mongoDb.collection('migration_checkpoints').insertOne(
+        {
+            sourceGbk: migrationConfig.sourceGbk || null,
+            bulkLoad: bulkLoadConfig.enabled,
+            finishedAt: new Date()
+        },
+        { writeConcern: { w: 'majority', j: true } }
+    );
+    console.log('Checkpoint durável gravado no MongoDB');
+}
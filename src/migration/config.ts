@@ -4,8 +4,9 @@ import path from 'path';
 
 dotenv.config();
 
-// Caminho do banco restaurado
-const restoredDbPath = path.join(process.cwd(), 'firebird', 'restored', 'millenium.fdb');
+// Caminho do banco restaurado (o automacao.py informa o caminho de cada origem)
+const restoredDbPath = process.env.MIGRATION_DATABASE
+    || path.join(process.cwd(), 'firebird', 'restored', 'millenium.fdb');
 
 export const firebirdConfig: Options = {
     host: process.env.FIREBIRD_HOST || 'localhost',
@@ -20,5 +21,80 @@ export const firebirdConfig: Options = {
 export const mongoConfig = {
     url: process.env.MONGO_URI || 'mongodb://localhost:27017',
     dbName: process.env.MONGO_DB_NAME || 'millenium_db',
-    batchSize: Number(process.env.BATCH_SIZE) || 1000
+    // Lotes iniciais; com ADAPTIVE_BATCHING são ajustados pelo batching.ts
+    batchSize: Number(process.env.BATCH_SIZE) || 25000,
+    largeTableBatchSize: Number(process.env.LARGE_TABLE_BATCH_SIZE) || 1000,
+    // Tabelas conhecidas por terem registros grandes começam com o lote menor
+    largeTables: (process.env.LARGE_TABLES || 'MOV_ESTOQUE,PRODUTOS,CLIENTES').split(',').map(t => t.trim()).filter(Boolean),
+    // Limite de conexões por processo (dividido entre origens pelo multi_source.py)
+    maxPoolSize: Number(process.env.MONGO_MAX_POOL_SIZE) || 100
+};
+
+// Ajuste automático dos lotes por tabela (tamanho médio das linhas e latência)
+export const batchingConfig = {
+    adaptive: (process.env.ADAPTIVE_BATCHING || 'true').toLowerCase() === 'true',
+    // Memória alvo de um lote de leitura e bytes alvo de cada insertMany
+    readTargetBytes: (Number(process.env.BATCH_TARGET_MB) || 32) * 1024 * 1024,
+    insertTargetBytes: (Number(process.env.INSERT_TARGET_MB) || 4) * 1024 * 1024,
+    // Latência alvo de um lote (leitura + gravação)
+    targetMs: Number(process.env.BATCH_TARGET_MS) || 5000,
+    minRows: Number(process.env.BATCH_MIN_ROWS) || 100,
+    maxRows: Number(process.env.BATCH_MAX_ROWS) || 100000,
+    // Arquivo com os tamanhos ajustados, reaproveitados na próxima execução
+    stateFile: process.env.BATCH_STATE_FILE || path.join(process.cwd(), 'batch_tuning.json')
+};
+
+// Leitura paralela das tabelas grandes (trechos por chave ou RDB$DB_KEY)
+const parallelReaders = Number(process.env.PARALLEL_READERS) || 4;
+export const parallelConfig = {
+    // Tabelas com pelo menos este número de registros são lidas em paralelo (0 = desativado)
+    threshold: Number(process.env.PARALLEL_READ_THRESHOLD ?? 1000000),
+    readers: parallelReaders,
+    // Gravações simultâneas no MongoDB compartilhadas pelos leitores
+    writers: Number(process.env.PARALLEL_WRITERS) || parallelReaders,
+    rangesPerReader: 4
+};
+
+// Pipeline de leitura, sanitização e gravação de cada tabela
+export const pipelineConfig = {
+    // Lotes aguardando entre uma etapa e a seguinte (limita a memória)
+    depth: Number(process.env.PIPELINE_DEPTH) || 2
+};
+
+// Perfil de carga em massa: índices secundários recriados no final e write concern relaxado
+export const bulkLoadConfig = {
+    enabled: (process.env.BULK_LOAD || 'false').toLowerCase() === 'true',
+    // Collections com índices sendo recriados ao mesmo tempo
+    indexParallelism: Number(process.env.BULK_INDEX_PARALLELISM) || 2,
+    // Definições dos índices removidos, até serem recriados
+    indexFile: process.env.BULK_INDEX_FILE || path.join(process.cwd(), 'bulk_indexes.json')
+};
+
+// Informações da execução atual (preenchidas pelo automacao.py)
+export const migrationConfig = {
+    sourceGbk: process.env.MIGRATION_SOURCE_GBK || '',
+    // Diretório com as tabelas lidas direto do GBK (gbk_reader.py); vazio usa o banco restaurado
+    inputDir: process.env.MIGRATION_INPUT_DIR || '',
+    // Relatório com as contagens de cada tabela, lido pela verificação (verify.ts)
+    reportFile: process.env.MIGRATION_REPORT || ''
+};
+
+// Verificação por amostragem após a migração
+export const verifyConfig = {
+    // A migração só cria o índice da chave (usado na amostragem) quando a verificação está habilitada
+    enabled: (process.env.VERIFY_ENABLED || 'false').toLowerCase() === 'true',
+    // Faixas de chave sorteadas por tabela e registros em cada faixa
+    samples: Number(process.env.VERIFY_SAMPLES) || 5,
+    rowsPerSample: Number(process.env.VERIFY_SAMPLE_ROWS) || 100,
+    // Tabelas verificadas ao mesmo tempo
+    parallelism: Number(process.env.VERIFY_PARALLELISM) || 4,
+    // Arquivo com o resultado (pass/fail por tabela), lido pelo automacao.py
+    outputFile: process.env.VERIFY_REPORT || path.join(process.cwd(), 'verify_report.json')
+};
+
+// Exportação de snapshot em arquivos locais, feita na mesma leitura da migração
+export const exportConfig = {
+    enabled: (process.env.EXPORT_ENABLED || 'false').toLowerCase() === 'true',
+    dir: process.env.EXPORT_DIR || path.join(process.cwd(), 'export'),
+    format: process.env.EXPORT_FORMAT || 'jsonl.gz'
 };
@@ -0,0 +1,171 @@
+import fs from 'fs';
+import path from 'path';
+import zlib from 'zlib';
+import crypto from 'crypto';
+import { once } from 'events';
+import { Transform, TransformCallback } from 'stream';
+import { pipeline } from 'stream/promises';
+import { BSON } from 'mongodb';
+import { exportConfig } from './config';
+
+export interface ExportedTable {
+    table: string;
+    file: string;
+    rows: number;
+    bytes: number;
+    sha256: string;
+}
+
+export interface SnapshotManifest {
+    source: any;
+    format: string;
+    tables: ExportedTable[];
+    failures: FailedTable[];
+}
+
+interface FailedTable {
+    table: string;
+    error: string;
+}
+
+// Cria o compressor de acordo com o formato configurado.
+// O zstd só existe nas versões mais novas do Node; sem ele, usa gzip.
+function createCompressor(format: string): { stream: Transform; extension: string } {
+    const zstd = (zlib as any).createZstdCompress;
+    if (format === 'jsonl.zst') {
+        if (typeof zstd === 'function') {
+            return { stream: zstd(), extension: 'jsonl.zst' };
+        }
+        console.warn('zstd não disponível nesta versão do Node. Usando gzip na exportação.');
+    } else if (format !== 'jsonl.gz') {
+        console.warn(`Formato de exportação desconhecido (${format}). Usando gzip.`);
+    }
+    return { stream: zlib.createGzip({ level: 6 }), extension: 'jsonl.gz' };
+}
+
+// Conta os bytes e calcula o hash do arquivo comprimido enquanto ele é gravado
+class DigestStream extends Transform {
+    bytes = 0;
+    private hash = crypto.createHash('sha256');
+
+    _transform(chunk: Buffer, _encoding: BufferEncoding, callback: TransformCallback) {
+        this.bytes += chunk.length;
+        this.hash.update(chunk);
+        callback(null, chunk);
+    }
+
+    digest(): string {
+        return this.hash.digest('hex');
+    }
+}
+
+// Grava as linhas de uma tabela em um arquivo JSONL comprimido.
+// A escrita respeita o backpressure do stream, então a memória fica limitada
+// ao buffer interno do compressor independente do tamanho da tabela.
+export class TableExportWriter {
+    private rows = 0;
+    private readonly compressor: Transform;
+    private readonly digest = new DigestStream();
+    private readonly done: Promise<void>;
+    private readonly tmpPath: string;
+    private readonly finalPath: string;
+
+    constructor(dir: string, private readonly table: string, format: string) {
+        const { stream, extension } = createCompressor(format);
+        this.compressor = stream;
+        this.finalPath = path.join(dir, `${table.toLowerCase()}.${extension}`);
+        this.tmpPath = `${this.finalPath}.tmp`;
+        this.done = pipeline(this.compressor, this.digest, fs.createWriteStream(this.tmpPath));
+        // Evita rejeição não tratada; o erro é propagado em write/close
+        this.done.catch(() => undefined);
+    }
+
+    async write(rows: any[]): Promise<void> {
+        for (const row of rows) {
+            if (!this.compressor.write(BSON.EJSON.stringify(row, { relaxed: true }) + '\n')) {
+                await once(this.compressor, 'drain');
+            }
+            this.rows++;
+        }
+    }
+
+    async close(): Promise<ExportedTable> {
+        this.compressor.end();
+        await this.done;
+        await fs.promises.rename(this.tmpPath, this.finalPath);
+        return {
+            table: this.table,
+            file: path.basename(this.finalPath),
+            rows: this.rows,
+            bytes: this.digest.bytes,
+            sha256: this.digest.digest()
+        };
+    }
+
+    async abort(): Promise<void> {
+        this.compressor.destroy();
+        await this.done.catch(() => undefined);
+        await fs.promises.rm(this.tmpPath, { force: true });
+    }
+}
+
+// Snapshot de uma execução: um arquivo por tabela e um manifest ligado ao .gbk de origem
+export class SnapshotExport {
+    readonly dir: string;
+    private readonly tables: ExportedTable[] = [];
+    private readonly failures: FailedTable[] = [];
+    private readonly startedAt = new Date();
+
+    constructor(private readonly sourceGbk: string) {
+        const name = sourceGbk
+            ? path.basename(sourceGbk, path.extname(sourceGbk))
+            : `snapshot-${this.startedAt.toISOString().replace(/[:.]/g, '-')}`;
+        this.dir = path.join(exportConfig.dir, name);
+        fs.mkdirSync(this.dir, { recursive: true });
+    }
+
+    openTable(table: string): TableExportWriter {
+        return new TableExportWriter(this.dir, table, exportConfig.format);
+    }
+
+    record(entry: ExportedTable) {
+        this.tables.push(entry);
+    }
+
+    recordFailure(table: string, error: any) {
+        this.failures.push({ table, error: String(error?.message || error) });
+    }
+
+    // O manifest é gravado por último; sua presença indica um snapshot completo
+    async writeManifest(): Promise<string> {
+        let source: any = null;
+        if (this.sourceGbk) {
+            source = { file: path.basename(this.sourceGbk) };
+            if (fs.existsSync(this.sourceGbk)) {
+                const stats = await fs.promises.stat(this.sourceGbk);
+                source.size = stats.size;
+                source.mtime = stats.mtime.toISOString();
+            }
+        }
+
+        const manifest = {
+            source,
+            format: exportConfig.format,
+            startedAt: this.startedAt.toISOString(),
+            finishedAt: new Date().toISOString(),
+            tables: this.tables,
+            failures: this.failures
+        };
+
+        const manifestPath = path.join(this.dir, 'manifest.json');
+        await fs.promises.writeFile(`${manifestPath}.tmp`, JSON.stringify(manifest, null, 2), 'utf-8');
+        await fs.promises.rename(`${manifestPath}.tmp`, manifestPath);
+        return manifestPath;
+    }
+}
+
+// Lê o manifest de um snapshot (ou da conversão feita pelo gbk_reader.py)
+export async function readManifest(dir: string): Promise<SnapshotManifest> {
+    const content = await fs.promises.readFile(path.join(dir, 'manifest.json'), 'utf-8');
+    return JSON.parse(content);
+}
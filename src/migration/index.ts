@@ -1,39 +1,17 @@
 import * as firebird from 'node-firebird';
-import { MongoClient } from 'mongodb';
-import { firebirdConfig, mongoConfig } from './config';
-
-// Função para sanitizar strings
-function sanitizeString(str: any): any {
-    if (str === null || str === undefined) return null;
-    if (typeof str !== 'string') return str;
-
-    return str
-        .normalize('NFD') // Decompõe os caracteres em seus componentes
-        .replace(/[\u0300-\u036f]/g, '') // Remove acentos
-        .replace(/[^\x20-\x7E]/g, '') // Remove caracteres não-ASCII
-        .replace(/�/g, '') // Remove caracteres inválidos específicos
-        .trim(); // Remove espaços extras
-}
-
-// Função para sanitizar objeto completo
-function sanitizeObject(obj: any): any {
-    if (obj === null || obj === undefined) return null;
-    if (typeof obj !== 'object') return sanitizeString(obj);
-
-    const newObj: any = {};
-    for (const key in obj) {
-        if (obj[key] instanceof Date) {
-            newObj[key.trim()] = obj[key];
-        } else if (Buffer.isBuffer(obj[key])) {
-            newObj[key.trim()] = obj[key].toString('base64');
-        } else if (typeof obj[key] === 'object') {
-            newObj[key.trim()] = sanitizeObject(obj[key]);
-        } else {
-            newObj[key.trim()] = sanitizeString(obj[key]);
-        }
-    }
-    return newObj;
-}
+import fs from 'fs';
+import path from 'path';
+import zlib from 'zlib';
+import { createInterface } from 'readline';
+import { MongoClient, BSON } from 'mongodb';
+import { firebirdConfig, mongoConfig, migrationConfig, exportConfig, batchingConfig, parallelConfig, pipelineConfig, bulkLoadConfig, verifyConfig } from './config';
+import { SnapshotExport, TableExportWriter, ExportedTable, readManifest } from './export';
+import { BatchTuner, BatchTuning, measureRowBytes } from './batching';
+import { sanitizeObject } from './sanitize';
+import { migrateTableParallel, getIntegerKey } from './parallel';
+import { runPipeline } from './pipeline';
+import { IndexRegistry, insertOptions, writeCheckpoint, KEY_INDEX_NAME } from './bulkload';
+import { LoadReport, LoadedTable } from './report';
 
 async function getTables(): Promise<string[]> {
     return new Promise((resolve, reject) => {
@@ -76,41 +54,170 @@ async function getTableCount(db: any, tableName: string): Promise<number> {
     });
 }
 
-async function migrateTableBatch(db: any, tableName: string, offset: number, batchSize: number, mongoCollection: any): Promise<number> {
-    return new Promise((resolve, reject) => {
-        const query = `SELECT FIRST ${batchSize} SKIP ${offset} * FROM ${tableName}`;
-        
-        db.query(query, [], async (err: any, result: any[]) => {
-            if (err) {
-                reject(err);
-                return;
-            }
+// Lote lido do Firebird (ou do arquivo do gbk_reader.py), ainda sem sanitizar
+interface RawBatch {
+    rows: any[];
+    elapsedMs: number;
+}
 
-            if (result.length === 0) {
-                resolve(0);
-                return;
-            }
+// Lote pronto para gravar
+interface ReadyBatch {
+    docs: any[];
+    rowBytes: number;
+    elapsedMs: number;
+}
 
-            try {
-                // Sanitiza os dados
-                const sanitizedData = result.map(row => sanitizeObject(row));
-
-                // Divide em lotes menores se necessário
-                const maxBatchSize = 1000;
-                for (let i = 0; i < sanitizedData.length; i += maxBatchSize) {
-                    const batch = sanitizedData.slice(i, i + maxBatchSize);
-                    await mongoCollection.insertMany(batch, { ordered: false });
-                }
+// Sanitiza um lote e mede o tamanho médio das linhas (usado no ajuste dos lotes)
+function transformBatch(batch: RawBatch): ReadyBatch {
+    const started = Date.now();
+    const docs = batch.rows.map(row => sanitizeObject(row));
+    const rowBytes = measureRowBytes(docs);
+    return { docs, rowBytes, elapsedMs: batch.elapsedMs + Date.now() - started };
+}
 
-                resolve(result.length);
-            } catch (error) {
-                reject(error);
+// Grava no MongoDB em inserções limitadas pelo orçamento de bytes do ajuste
+async function insertDocs(docs: any[], mongoCollection: any, tuner: BatchTuner): Promise<void> {
+    let i = 0;
+    while (i < docs.length) {
+        const chunk = docs.slice(i, i + tuner.insertSize);
+        try {
+            await mongoCollection.insertMany(chunk, insertOptions());
+            i += chunk.length;
+        } catch (error: any) {
+            // Se der erro por tamanho, reduz o lote pela metade e tenta novamente
+            if (error.code === 10334 && chunk.length > 1) { // BSONObjectTooLarge
+                tuner.shrink();
+                console.log(`Reduzindo tamanho do lote para ${tuner.insertSize} e tentando novamente...`);
+                continue;
             }
+            throw error;
+        }
+    }
+}
+
+// Grava um lote no MongoDB (e no snapshot, se habilitado) e alimenta o ajuste dos lotes
+async function writeBatch(batch: ReadyBatch, mongoCollection: any, exportWriter: TableExportWriter | null, tuner: BatchTuner): Promise<void> {
+    const started = Date.now();
+
+    // Grava o mesmo lote no snapshot, aproveitando a leitura já feita. Vem antes da
+    // inserção porque o insertMany acrescenta aos documentos o _id gerado pelo driver
+    if (exportWriter) {
+        await exportWriter.write(batch.docs);
+    }
+
+    await insertDocs(batch.docs, mongoCollection, tuner);
+
+    tuner.observe(batch.rowBytes, batch.docs.length, batch.elapsedMs + Date.now() - started);
+}
+
+// Prepara a collection para a carga: remove os índices secundários (perfil de
+// carga em massa), o índice da chave e os documentos da execução anterior
+async function prepareCollection(mongoDb: any, tableName: string, indexes: IndexRegistry | null): Promise<any> {
+    const collectionName = tableName.toLowerCase();
+    if (indexes) {
+        await indexes.dropSecondaryIndexes(mongoDb, collectionName);
+    }
+
+    const collection = mongoDb.collection(collectionName);
+    await dropKeyIndex(collection);
+
+    // Limpa a collection antes de inserir
+    console.log(`Limpando collection ${collectionName}`);
+    await collection.deleteMany({});
+    return collection;
+}
+
+// O índice da chave não é mantido durante a carga: é recriado no final, se necessário
+async function dropKeyIndex(collection: any): Promise<void> {
+    try {
+        await collection.dropIndex(KEY_INDEX_NAME);
+    } catch (error: any) {
+        if (error.codeName !== 'IndexNotFound' && error.codeName !== 'NamespaceNotFound') throw error;
+    }
+}
+
+// Indexa a chave primária inteira depois da carga, para que a verificação
+// consulte faixas de chave sem percorrer a collection inteira
+async function createKeyIndex(db: any, tableName: string, collection: any): Promise<void> {
+    if (!verifyConfig.enabled) return;
+    try {
+        const key = await getIntegerKey(db, tableName);
+        if (key) {
+            await collection.createIndex({ [key]: 1 }, { name: KEY_INDEX_NAME });
+        }
+    } catch (error) {
+        console.warn(`Não foi possível indexar a chave de ${tableName}:`, error);
+    }
+}
+
+function queryBatch(db: any, tableName: string, offset: number, batchSize: number): Promise<any[]> {
+    return new Promise((resolve, reject) => {
+        const query = `SELECT FIRST ${batchSize} SKIP ${offset} * FROM ${tableName}`;
+        db.query(query, [], (err: any, result: any[]) => {
+            if (err) reject(err);
+            else resolve(result || []);
         });
     });
 }
 
-async function migrateTable(tableName: string, mongoDb: any): Promise<void> {
+// Lê a tabela em lotes sequenciais; o próximo lote é pedido assim que o anterior
+// entra na fila do pipeline, sem esperar a gravação
+async function* readTableBatches(db: any, tableName: string, total: number, tuner: BatchTuner): AsyncGenerator<RawBatch> {
+    let offset = 0;
+    while (offset < total) {
+        const started = Date.now();
+        const rows = await queryBatch(db, tableName, offset, tuner.readSize);
+        if (rows.length === 0) return;
+        offset += rows.length;
+        yield { rows, elapsedMs: Date.now() - started };
+    }
+}
+
+// Lê o arquivo do gbk_reader.py em lotes (JSON estendido: datas chegam como {"$date": ...})
+async function* readFileBatches(file: string, tuner: BatchTuner): AsyncGenerator<RawBatch> {
+    const lines = createInterface({
+        input: fs.createReadStream(file).pipe(zlib.createGunzip()),
+        crlfDelay: Infinity
+    });
+
+    let rows: any[] = [];
+    let started = Date.now();
+    for await (const line of lines) {
+        if (!line) continue;
+        rows.push(BSON.EJSON.parse(line, { relaxed: true }));
+        if (rows.length >= tuner.readSize) {
+            yield { rows, elapsedMs: Date.now() - started };
+            rows = [];
+            started = Date.now();
+        }
+    }
+    if (rows.length > 0) {
+        yield { rows, elapsedMs: Date.now() - started };
+    }
+}
+
+// Grava os lotes de uma tabela mostrando o progresso e contando os registros gravados
+class ProgressWriter {
+    processedCount = 0;
+
+    constructor(
+        private readonly total: number,
+        private readonly mongoCollection: any,
+        private readonly exportWriter: TableExportWriter | null,
+        private readonly tuner: BatchTuner
+    ) {}
+
+    write = async (batch: ReadyBatch): Promise<void> => {
+        await writeBatch(batch, this.mongoCollection, this.exportWriter, this.tuner);
+        this.processedCount += batch.docs.length;
+        if (this.total > 0) {
+            const progress = Math.round((this.processedCount / this.total) * 100);
+            console.log(`Progresso: ${progress}% (${this.processedCount}/${this.total})`);
+        }
+    };
+}
+
+async function migrateTable(tableName: string, mongoDb: any, snapshot: SnapshotExport | null, tuning: BatchTuning, indexes: IndexRegistry | null): Promise<LoadedTable> {
     return new Promise((resolve, reject) => {
         firebird.attach(firebirdConfig, async (err, db) => {
             if (err) {
@@ -118,53 +225,57 @@ async function migrateTable(tableName: string, mongoDb: any): Promise<void> {
                 return;
             }
 
+            let exportWriter: TableExportWriter | null = null;
             try {
                 console.log(`\nIniciando migração da tabela ${tableName}`);
-                const collection = mongoDb.collection(tableName.toLowerCase());
-                
-                // Limpa a collection antes de inserir
-                console.log(`Limpando collection ${tableName.toLowerCase()}`);
-                await collection.deleteMany({});
+                const collection = await prepareCollection(mongoDb, tableName, indexes);
 
                 // Obtém o total de registros
                 const total = await getTableCount(db, tableName);
                 console.log(`Total de registros: ${total}`);
 
-                // Define o tamanho do lote baseado na tabela
-                // Tabelas conhecidas por terem registros grandes usam lotes menores
-                let batchSize = 25000;
-                const largeTables = ['MOV_ESTOQUE', 'PRODUTOS', 'CLIENTES'];
-                if (largeTables.includes(tableName)) {
-                    batchSize = 1000; // Lote menor para tabelas grandes
+                // Tamanho do lote: ajustado na última execução ou o padrão do .env
+                const tuner = tuning.tunerFor(tableName);
+                console.log(`Tamanho inicial do lote: ${tuner.readSize} registros`);
+
+                if (snapshot) {
+                    exportWriter = snapshot.openTable(tableName);
                 }
 
-                let processedCount = 0;
-                while (processedCount < total) {
-                    try {
-                        const count = await migrateTableBatch(db, tableName, processedCount, batchSize, collection);
-                        processedCount += count;
-                        
-                        // Mostra progresso
-                        if (total > 0) {
-                            const progress = Math.round((processedCount / total) * 100);
-                            console.log(`Progresso: ${progress}% (${processedCount}/${total})`);
-                        }
-                    } catch (batchError: any) {
-                        // Se der erro por tamanho, reduz o lote pela metade e tenta novamente
-                        if (batchError.code === 10334) { // BSONObjectTooLarge
-                            batchSize = Math.max(100, Math.floor(batchSize / 2));
-                            console.log(`Reduzindo tamanho do lote para ${batchSize} e tentando novamente...`);
-                            continue;
-                        }
-                        throw batchError;
-                    }
+                const progress = new ProgressWriter(total, collection, exportWriter, tuner);
+                const write = progress.write;
+
+                // Tabelas grandes: vários leitores em trechos disjuntos, gravando na mesma collection
+                let parallelDone = false;
+                if (parallelConfig.threshold > 0 && parallelConfig.readers > 1 && total >= parallelConfig.threshold) {
+                    parallelDone = await migrateTableParallel(tableName, tuner,
+                        (rows, elapsedMs) => write(transformBatch({ rows, elapsedMs })));
                 }
 
+                // Demais tabelas: leitura, sanitização e gravação sobrepostas
+                if (!parallelDone) {
+                    await runPipeline(readTableBatches(db, tableName, total, tuner), transformBatch, write, pipelineConfig.depth);
+                }
+
+                await createKeyIndex(db, tableName, collection);
+
+                if (snapshot && exportWriter) {
+                    snapshot.record(await exportWriter.close());
+                    exportWriter = null;
+                }
+                tuning.record(tuner);
+
                 console.log(`✅ Tabela ${tableName} migrada com sucesso`);
                 db.detach();
-                resolve();
+                resolve({ table: tableName, sourceRows: total, loadedRows: progress.processedCount });
             } catch (error) {
                 console.error(`Erro ao migrar tabela ${tableName}:`, error);
+                if (snapshot) {
+                    snapshot.recordFailure(tableName, error);
+                    if (exportWriter) {
+                        await exportWriter.abort();
+                    }
+                }
                 db.detach();
                 reject(error);
             }
@@ -172,30 +283,118 @@ async function migrateTable(tableName: string, mongoDb: any): Promise<void> {
     });
 }
 
+// Migra uma tabela a partir do arquivo gerado pelo gbk_reader.py (sem banco restaurado)
+async function migrateTableFromFile(entry: ExportedTable, inputDir: string, mongoDb: any, snapshot: SnapshotExport | null, tuning: BatchTuning, indexes: IndexRegistry | null): Promise<LoadedTable> {
+    console.log(`\nIniciando migração da tabela ${entry.table}`);
+    const collection = await prepareCollection(mongoDb, entry.table, indexes);
+
+    const total = entry.rows;
+    console.log(`Total de registros: ${total}`);
+
+    const exportWriter = snapshot ? snapshot.openTable(entry.table) : null;
+    try {
+        const tuner = tuning.tunerFor(entry.table);
+        const progress = new ProgressWriter(total, collection, exportWriter, tuner);
+        await runPipeline(readFileBatches(path.join(inputDir, entry.file), tuner), transformBatch, progress.write, pipelineConfig.depth);
+
+        if (snapshot && exportWriter) {
+            snapshot.record(await exportWriter.close());
+        }
+        tuning.record(tuner);
+        return { table: entry.table, sourceRows: total, loadedRows: progress.processedCount };
+    } catch (error) {
+        if (snapshot) {
+            snapshot.recordFailure(entry.table, error);
+            if (exportWriter) {
+                await exportWriter.abort();
+            }
+        }
+        throw error;
+    }
+}
+
 async function main() {
     try {
         console.log('Iniciando processo de migração...');
-        console.log(`Usando tamanho de lote: ${mongoConfig.batchSize}`);
+        console.log(`Usando tamanho de lote: ${mongoConfig.batchSize} (tabelas grandes: ${mongoConfig.largeTableBatchSize})`);
         
         // Conectar ao MongoDB
-        const mongoClient = await MongoClient.connect(mongoConfig.url);
+        const mongoClient = await MongoClient.connect(mongoConfig.url, { maxPoolSize: mongoConfig.maxPoolSize });
         const mongoDb = mongoClient.db(mongoConfig.dbName);
+
+        // Snapshot opcional em arquivos locais
+        let snapshot: SnapshotExport | null = null;
+        if (exportConfig.enabled) {
+            snapshot = new SnapshotExport(migrationConfig.sourceGbk);
+            console.log(`Exportando snapshot para ${snapshot.dir}`);
+        }
         
-        // Pegar lista de tabelas
-        const tables = await getTables();
-        console.log(`\nEncontradas ${tables.length} tabelas para migrar`);
-        
-        // Migrar cada tabela
-        for (const table of tables) {
-            try {
-                await migrateTable(table, mongoDb);
-                console.log(`✅ Tabela ${table} migrada com sucesso`);
-            } catch (error) {
-                console.error(`❌ Erro ao migrar tabela ${table}:`, error);
-                // Continua para a próxima tabela mesmo se houver erro
+        // Tamanhos de lote ajustados nas execuções anteriores
+        const tuning = new BatchTuning(batchingConfig.stateFile);
+
+        // Perfil de carga em massa: índices recriados só no final
+        const indexes = bulkLoadConfig.enabled ? new IndexRegistry(bulkLoadConfig.indexFile) : null;
+        if (indexes) {
+            console.log('Perfil de carga em massa ativado (índices adiados, write concern relaxado)');
+        }
+
+        // Contagens de cada tabela, usadas pela verificação após a migração
+        const report = new LoadReport(migrationConfig.inputDir ? 'gbk' : 'firebird');
+
+        if (migrationConfig.inputDir) {
+            // Leitura direta do GBK: as tabelas vêm dos arquivos do gbk_reader.py
+            const manifest = await readManifest(migrationConfig.inputDir);
+            console.log(`\nEncontradas ${manifest.tables.length} tabelas para migrar em ${migrationConfig.inputDir}`);
+
+            for (const entry of manifest.tables) {
+                try {
+                    report.record(await migrateTableFromFile(entry, migrationConfig.inputDir, mongoDb, snapshot, tuning, indexes));
+                    console.log(`✅ Tabela ${entry.table} migrada com sucesso`);
+                } catch (error) {
+                    console.error(`❌ Erro ao migrar tabela ${entry.table}:`, error);
+                    report.recordFailure(entry.table, error);
+                }
+            }
+        } else {
+            // Pegar lista de tabelas
+            const tables = await getTables();
+            console.log(`\nEncontradas ${tables.length} tabelas para migrar`);
+            
+            // Migrar cada tabela
+            for (const table of tables) {
+                try {
+                    report.record(await migrateTable(table, mongoDb, snapshot, tuning, indexes));
+                    console.log(`✅ Tabela ${table} migrada com sucesso`);
+                } catch (error) {
+                    console.error(`❌ Erro ao migrar tabela ${table}:`, error);
+                    report.recordFailure(table, error);
+                    // Continua para a próxima tabela mesmo se houver erro
+                }
             }
         }
         
+        if (migrationConfig.reportFile) {
+            await report.save(migrationConfig.reportFile);
+        }
+
+        if (indexes) {
+            // Recria os índices (inclusive de tabelas que falharam) e aguarda a
+            // durabilidade de toda a carga antes de encerrar com sucesso
+            await indexes.rebuildIndexes(mongoDb);
+            await writeCheckpoint(mongoDb);
+        }
+
+        try {
+            await tuning.save();
+        } catch (error) {
+            console.warn('Erro ao salvar o ajuste dos lotes:', error);
+        }
+
+        if (snapshot) {
+            const manifestPath = await snapshot.writeManifest();
+            console.log(`Manifest do snapshot gravado em ${manifestPath}`);
+        }
+
         await mongoClient.close();
         console.log('\nMigração concluída!');
         
@@ -0,0 +1,224 @@
+import * as firebird from 'node-firebird';
+import { firebirdConfig, parallelConfig } from './config';
+import { BatchTuner } from './batching';
+
+// Trecho disjunto de uma tabela, lido por um único leitor
+interface ReadRange {
+    // Condição SQL que delimita o trecho
+    where: string;
+    // Chave inteira para paginação por chave (ausente nos trechos por RDB$DB_KEY)
+    key?: string;
+    from?: number;
+    to?: number;
+}
+
+// Recebe o lote lido e o tempo gasto na leitura
+type WriteFunction = (rows: any[], elapsedMs: number) => Promise<void>;
+
+// Tipos inteiros do Firebird (SMALLINT, INTEGER, BIGINT) em RDB$FIELDS
+const INTEGER_TYPES = [7, 8, 16];
+
+export function attach(): Promise<any> {
+    return new Promise((resolve, reject) => {
+        firebird.attach(firebirdConfig, (err, db) => {
+            if (err) reject(err);
+            else resolve(db);
+        });
+    });
+}
+
+export function query(db: any, sql: string, params: any[] = []): Promise<any[]> {
+    return new Promise((resolve, reject) => {
+        db.query(sql, params, (err: any, result: any[]) => {
+            if (err) reject(err);
+            else resolve(result || []);
+        });
+    });
+}
+
+// Chave primária de uma coluna inteira, usada para dividir a tabela em faixas de chave
+export async function getIntegerKey(db: any, tableName: string): Promise<string | null> {
+    const result = await query(db, `
+        SELECT TRIM(s.RDB$FIELD_NAME) AS FIELD_NAME, f.RDB$FIELD_TYPE AS FIELD_TYPE, f.RDB$FIELD_SCALE AS FIELD_SCALE
+        FROM RDB$RELATION_CONSTRAINTS c
+        JOIN RDB$INDEX_SEGMENTS s ON s.RDB$INDEX_NAME = c.RDB$INDEX_NAME
+        JOIN RDB$RELATION_FIELDS rf ON rf.RDB$RELATION_NAME = c.RDB$RELATION_NAME AND rf.RDB$FIELD_NAME = s.RDB$FIELD_NAME
+        JOIN RDB$FIELDS f ON f.RDB$FIELD_NAME = rf.RDB$FIELD_SOURCE
+        WHERE c.RDB$RELATION_NAME = ? AND c.RDB$CONSTRAINT_TYPE = 'PRIMARY KEY'
+    `, [tableName]);
+
+    if (result.length !== 1) return null;
+    const field = result[0];
+    if (!INTEGER_TYPES.includes(field.FIELD_TYPE) || field.FIELD_SCALE) return null;
+    return field.FIELD_NAME;
+}
+
+// Divide [MIN, MAX] da chave em faixas de mesma largura
+async function planKeyRanges(db: any, tableName: string, key: string, count: number): Promise<ReadRange[]> {
+    const [bounds] = await query(db, `SELECT MIN(${key}) AS LO, MAX(${key}) AS HI FROM ${tableName}`);
+    if (bounds.LO === null || bounds.HI === null) return [];
+
+    const lo = Number(bounds.LO);
+    const hi = Number(bounds.HI);
+    const width = Math.max(1, Math.ceil((hi - lo + 1) / count));
+    const ranges: ReadRange[] = [];
+    for (let from = lo; from <= hi; from += width) {
+        const to = Math.min(hi, from + width - 1);
+        ranges.push({ where: `${key} >= ${from} AND ${key} <= ${to}`, key, from, to });
+    }
+    return ranges;
+}
+
+// MAKE_DBKEY só existe a partir do Firebird 4.0
+async function supportsMakeDbKey(db: any): Promise<boolean> {
+    const [row] = await query(db, `SELECT RDB$GET_CONTEXT('SYSTEM', 'ENGINE_VERSION') AS VERSION FROM RDB$DATABASE`);
+    const major = parseInt(String(row?.VERSION || '0'), 10);
+    return major >= 4;
+}
+
+// Sem chave utilizável, divide a tabela pelas páginas de ponteiros (RDB$DB_KEY).
+// Retorna [] quando o servidor não suporta MAKE_DBKEY (Firebird 3.0)
+async function planDbKeyRanges(db: any, tableName: string, count: number): Promise<ReadRange[]> {
+    if (!await supportsMakeDbKey(db)) {
+        console.log(`Leitura paralela de ${tableName} indisponível: tabela sem chave inteira e MAKE_DBKEY requer Firebird 4.0`);
+        return [];
+    }
+
+    const [pages] = await query(db, `
+        SELECT COUNT(*) AS TOTAL
+        FROM RDB$PAGES p
+        JOIN RDB$RELATIONS r ON r.RDB$RELATION_ID = p.RDB$RELATION_ID
+        WHERE r.RDB$RELATION_NAME = ? AND p.RDB$PAGE_TYPE = 4
+    `, [tableName]);
+
+    const pointerPages = Number(pages.TOTAL);
+    if (pointerPages < 2) return [];
+
+    const step = Math.max(1, Math.ceil(pointerPages / count));
+    const ranges: ReadRange[] = [];
+    for (let first = 0; first < pointerPages; first += step) {
+        const next = first + step;
+        const conditions = [];
+        if (first > 0) conditions.push(`RDB$DB_KEY >= MAKE_DBKEY('${tableName}', 0, 0, ${first})`);
+        if (next < pointerPages) conditions.push(`RDB$DB_KEY < MAKE_DBKEY('${tableName}', 0, 0, ${next})`);
+        ranges.push({ where: conditions.join(' AND ') });
+    }
+    return ranges;
+}
+
+// Grava os lotes de vários leitores com no máximo `size` gravações simultâneas.
+// Quando todas estão ocupadas, `submit` aguarda, segurando os leitores (backpressure).
+export class WriterPool {
+    private readonly running = new Set<Promise<void>>();
+    private error: any = null;
+
+    constructor(private readonly size: number, private readonly write: WriteFunction) {}
+
+    get failed(): boolean {
+        return this.error !== null;
+    }
+
+    fail(error: any) {
+        if (this.error === null) this.error = error;
+    }
+
+    async submit(rows: any[], elapsedMs: number): Promise<void> {
+        while (this.running.size >= this.size) {
+            await Promise.race(this.running);
+        }
+        if (this.error) throw this.error;
+
+        const task: Promise<void> = this.write(rows, elapsedMs)
+            .catch(error => this.fail(error))
+            .finally(() => this.running.delete(task));
+        this.running.add(task);
+    }
+
+    async drain(): Promise<void> {
+        while (this.running.size > 0) {
+            await Promise.race(this.running);
+        }
+        if (this.error) throw this.error;
+    }
+}
+
+// Lê um trecho em lotes: por chave (sem SKIP) ou com SKIP restrito ao trecho
+async function readRange(db: any, tableName: string, range: ReadRange, tuner: BatchTuner, pool: WriterPool): Promise<void> {
+    let from = range.from;
+    let offset = 0;
+    while (!pool.failed) {
+        const started = Date.now();
+        const size = tuner.readSize;
+        let sql: string;
+        if (range.key) {
+            sql = `SELECT FIRST ${size} * FROM ${tableName} WHERE ${range.key} >= ${from} AND ${range.key} <= ${range.to} ORDER BY ${range.key}`;
+        } else {
+            const where = range.where ? `WHERE ${range.where}` : '';
+            sql = `SELECT FIRST ${size} SKIP ${offset} * FROM ${tableName} ${where}`;
+        }
+
+        const rows = await query(db, sql);
+        if (rows.length === 0) return;
+        await pool.submit(rows, Date.now() - started);
+        if (rows.length < size) return;
+
+        if (range.key) {
+            from = Number(rows[rows.length - 1][range.key]) + 1;
+        } else {
+            offset += rows.length;
+        }
+    }
+}
+
+// Migra uma tabela grande com vários leitores, cada um com sua conexão, lendo
+// trechos disjuntos e entregando os lotes a um pool de gravação compartilhado.
+// Retorna false se a tabela não puder ser dividida (a migração segue serial).
+export async function migrateTableParallel(tableName: string, tuner: BatchTuner, write: WriteFunction): Promise<boolean> {
+    const rangeCount = parallelConfig.readers * parallelConfig.rangesPerReader;
+
+    // Planejamento e uma leitura de teste de um trecho, antes de gravar qualquer
+    // registro: se algo falhar aqui, a tabela segue pelo caminho serial
+    let ranges: ReadRange[] = [];
+    let db: any = null;
+    try {
+        db = await attach();
+        const key = await getIntegerKey(db, tableName);
+        ranges = key
+            ? await planKeyRanges(db, tableName, key, rangeCount)
+            : await planDbKeyRanges(db, tableName, rangeCount);
+        if (ranges.length > 1) {
+            const probe = ranges.find(range => range.where.includes(' AND ')) || ranges[ranges.length - 1];
+            await query(db, `SELECT FIRST 1 * FROM ${tableName} WHERE ${probe.where}`);
+            console.log(`Leitura paralela de ${tableName}: ${ranges.length} trechos por ${key ? `chave ${key}` : 'RDB$DB_KEY'}, ${parallelConfig.readers} leitores`);
+        }
+    } catch (error) {
+        console.warn(`Leitura paralela de ${tableName} indisponível, usando leitura serial:`, error);
+        ranges = [];
+    } finally {
+        if (db) db.detach();
+    }
+
+    if (ranges.length < 2) return false;
+
+    // Os leitores consomem os trechos de uma fila comum; há mais trechos que
+    // leitores para que faixas de chave desbalanceadas não deixem leitores ociosos
+    const pending = [...ranges];
+    const pool = new WriterPool(parallelConfig.writers, write);
+    const readers = Array.from({ length: Math.min(parallelConfig.readers, ranges.length) }, async () => {
+        let readerDb: any = null;
+        try {
+            readerDb = await attach();
+            while (pending.length > 0 && !pool.failed) {
+                await readRange(readerDb, tableName, pending.shift()!, tuner, pool);
+            }
+        } catch (error) {
+            pool.fail(error);
+        } finally {
+            if (readerDb) readerDb.detach();
+        }
+    });
+
+    await Promise.all(readers);
+    await pool.drain();
+    return true;
+}
@@ -0,0 +1,108 @@
+// Fila limitada entre duas etapas do pipeline.
+// `push` aguarda enquanto a fila está cheia (backpressure) e `pop` enquanto está vazia;
+// `pop` retorna undefined quando a fila foi fechada e não há mais itens.
+export class BoundedQueue<T> {
+    private readonly items: T[] = [];
+    private waiting: (() => void)[] = [];
+    private closed = false;
+    private error: any = null;
+
+    constructor(private readonly capacity: number) {}
+
+    private wake() {
+        const waiting = this.waiting;
+        this.waiting = [];
+        waiting.forEach(resolve => resolve());
+    }
+
+    private wait(): Promise<void> {
+        return new Promise(resolve => this.waiting.push(resolve));
+    }
+
+    async push(item: T): Promise<void> {
+        while (this.items.length >= this.capacity && this.error === null) {
+            await this.wait();
+        }
+        if (this.error !== null) throw this.error;
+        this.items.push(item);
+        this.wake();
+    }
+
+    async pop(): Promise<T | undefined> {
+        while (this.items.length === 0 && !this.closed && this.error === null) {
+            await this.wait();
+        }
+        if (this.error !== null) throw this.error;
+        const item = this.items.shift();
+        this.wake();
+        return item;
+    }
+
+    close() {
+        this.closed = true;
+        this.wake();
+    }
+
+    // Interrompe a fila: as etapas que aguardam recebem o erro
+    fail(error: any) {
+        if (this.error === null) this.error = error;
+        this.wake();
+    }
+}
+
+// Executa leitura, transformação e gravação ao mesmo tempo, ligadas por filas de
+// `depth` lotes. Enquanto um lote é gravado, o próximo já está sendo transformado e
+// o seguinte lido, então o tempo total se aproxima do da etapa mais lenta. A memória
+// fica limitada a cerca de 2 * depth + 3 lotes. O primeiro erro interrompe as três etapas.
+export async function runPipeline<R, T>(
+    source: AsyncIterable<R>,
+    transform: (item: R) => T,
+    sink: (item: T) => Promise<void>,
+    depth: number
+): Promise<void> {
+    const raw = new BoundedQueue<R>(depth);
+    const ready = new BoundedQueue<T>(depth);
+    let failure: any = null;
+    const fail = (error: any) => {
+        if (failure === null) failure = error;
+        raw.fail(error);
+        ready.fail(error);
+    };
+
+    const reader = (async () => {
+        try {
+            for await (const item of source) {
+                await raw.push(item);
+            }
+            raw.close();
+        } catch (error) {
+            fail(error);
+        }
+    })();
+
+    const transformer = (async () => {
+        try {
+            let item: R | undefined;
+            while ((item = await raw.pop()) !== undefined) {
+                await ready.push(transform(item));
+            }
+            ready.close();
+        } catch (error) {
+            fail(error);
+        }
+    })();
+
+    const writer = (async () => {
+        try {
+            let item: T | undefined;
+            while ((item = await ready.pop()) !== undefined) {
+                await sink(item);
+            }
+        } catch (error) {
+            fail(error);
+        }
+    })();
+
+    await Promise.all([reader, transformer, writer]);
+    if (failure !== null) throw failure;
+}
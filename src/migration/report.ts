@@ -0,0 +1,46 @@
+import fs from 'fs';
+
+// Contagens de uma tabela obtidas durante a carga, sem consultas extras
+export interface LoadedTable {
+    table: string;
+    // null quando a tabela falhou antes de terminar a carga
+    sourceRows: number | null;
+    loadedRows: number | null;
+    error?: string;
+}
+
+export interface LoadReportData {
+    // 'firebird' (banco restaurado) ou 'gbk' (arquivos do gbk_reader.py)
+    source: string;
+    finishedAt: string;
+    tables: LoadedTable[];
+}
+
+// Relatório da carga lido pela etapa de verificação (verify.ts)
+export class LoadReport {
+    private readonly tables: LoadedTable[] = [];
+
+    constructor(private readonly source: string) {}
+
+    record(entry: LoadedTable) {
+        this.tables.push(entry);
+    }
+
+    recordFailure(table: string, error: any) {
+        this.tables.push({ table, sourceRows: null, loadedRows: null, error: String(error?.message || error) });
+    }
+
+    async save(file: string): Promise<void> {
+        const data: LoadReportData = {
+            source: this.source,
+            finishedAt: new Date().toISOString(),
+            tables: this.tables
+        };
+        await fs.promises.writeFile(`${file}.tmp`, JSON.stringify(data, null, 2), 'utf-8');
+        await fs.promises.rename(`${file}.tmp`, file);
+    }
+}
+
+export async function readLoadReport(file: string): Promise<LoadReportData> {
+    return JSON.parse(await fs.promises.readFile(file, 'utf-8'));
+}
@@ -0,0 +1,32 @@
+// Função para sanitizar strings
+export function sanitizeString(str: any): any {
+    if (str === null || str === undefined) return null;
+    if (typeof str !== 'string') return str;
+
+    return str
+        .normalize('NFD') // Decompõe os caracteres em seus componentes
+        .replace(/[\u0300-\u036f]/g, '') // Remove acentos
+        .replace(/[^\x20-\x7E]/g, '') // Remove caracteres não-ASCII
+        .replace(/�/g, '') // Remove caracteres inválidos específicos
+        .trim(); // Remove espaços extras
+}
+
+// Função para sanitizar objeto completo
+export function sanitizeObject(obj: any): any {
+    if (obj === null || obj === undefined) return null;
+    if (typeof obj !== 'object') return sanitizeString(obj);
+
+    const newObj: any = {};
+    for (const key in obj) {
+        if (obj[key] instanceof Date) {
+            newObj[key.trim()] = obj[key];
+        } else if (Buffer.isBuffer(obj[key])) {
+            newObj[key.trim()] = obj[key].toString('base64');
+        } else if (typeof obj[key] === 'object') {
+            newObj[key.trim()] = sanitizeObject(obj[key]);
+        } else {
+            newObj[key.trim()] = sanitizeString(obj[key]);
+        }
+    }
+    return newObj;
+}
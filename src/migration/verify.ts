@@ -0,0 +1,194 @@
+import fs from 'fs';
+import crypto from 'crypto';
+import { MongoClient } from 'mongodb';
+import { mongoConfig, migrationConfig, verifyConfig } from './config';
+import { readLoadReport, LoadedTable } from './report';
+import { sanitizeObject } from './sanitize';
+import { attach, query, getIntegerKey } from './parallel';
+import { KEY_INDEX_NAME } from './bulkload';
+
+interface TableVerification {
+    table: string;
+    passed: boolean;
+    sourceRows: number | null;
+    loadedRows: number | null;
+    mongoRows: number | null;
+    sampledRows: number;
+    mismatches: number;
+    // Motivo de a amostragem não ter sido feita, quando for o caso
+    sampleSkipped?: string;
+    errors: string[];
+}
+
+// Valor com as chaves ordenadas e sem o _id, para que o hash independa da ordem dos campos
+function canonical(value: any): any {
+    if (value instanceof Date) return value.toISOString();
+    if (Array.isArray(value)) return value.map(canonical);
+    if (value !== null && typeof value === 'object') {
+        const result: any = {};
+        for (const key of Object.keys(value).sort()) {
+            if (key !== '_id') result[key] = canonical(value[key]);
+        }
+        return result;
+    }
+    return value;
+}
+
+function rowHash(row: any): string {
+    return crypto.createHash('sha256').update(JSON.stringify(canonical(row))).digest('hex');
+}
+
+// Compara faixas de chave sorteadas: as linhas do Firebird passam pela mesma
+// sanitização da migração e o hash de cada uma é comparado ao do documento no MongoDB
+async function sampleTable(db: any, collection: any, table: string, key: string, result: TableVerification): Promise<void> {
+    const [bounds] = await query(db, `SELECT MIN(${key}) AS LO, MAX(${key}) AS HI FROM ${table}`);
+    if (bounds.LO === null || bounds.HI === null) return;
+
+    const lo = Number(bounds.LO);
+    const hi = Number(bounds.HI);
+    for (let i = 0; i < verifyConfig.samples; i++) {
+        const start = Math.floor(lo + Math.random() * (hi - lo + 1));
+        const rows = await query(db, `SELECT FIRST ${verifyConfig.rowsPerSample} * FROM ${table} WHERE ${key} >= ${start} ORDER BY ${key}`);
+        if (rows.length === 0) continue;
+
+        const expected = new Map<number, string>();
+        for (const row of rows) {
+            const doc = sanitizeObject(row);
+            expected.set(Number(doc[key]), rowHash(doc));
+        }
+
+        const first = Number(rows[0][key]);
+        const last = Number(rows[rows.length - 1][key]);
+        const docs = await collection.find({ [key]: { $gte: first, $lte: last } }).toArray();
+        const actual = new Map<number, string>();
+        for (const doc of docs) {
+            actual.set(Number(doc[key]), rowHash(doc));
+        }
+
+        result.sampledRows += expected.size;
+        for (const [value, hash] of expected) {
+            if (actual.get(value) !== hash) result.mismatches++;
+        }
+        // Documentos a mais na faixa (duplicados ou inexistentes no Firebird)
+        result.mismatches += Math.max(0, docs.length - expected.size);
+    }
+}
+
+async function hasKeyIndex(collection: any, key: string): Promise<boolean> {
+    const indexes = await collection.indexes();
+    return indexes.some((index: any) => index.name === KEY_INDEX_NAME || Object.keys(index.key)[0] === key);
+}
+
+async function verifyTable(entry: LoadedTable, mongoDb: any, db: any | null): Promise<TableVerification> {
+    const result: TableVerification = {
+        table: entry.table,
+        passed: false,
+        sourceRows: entry.sourceRows,
+        loadedRows: entry.loadedRows,
+        mongoRows: null,
+        sampledRows: 0,
+        mismatches: 0,
+        errors: []
+    };
+
+    if (entry.error || entry.sourceRows === null) {
+        result.errors.push(`Falha na carga: ${entry.error}`);
+        return result;
+    }
+
+    try {
+        const collection = mongoDb.collection(entry.table.toLowerCase());
+
+        // Contagem pelos metadados da collection; só conta os documentos se ela divergir
+        let mongoRows = await collection.estimatedDocumentCount();
+        if (mongoRows !== entry.sourceRows) {
+            mongoRows = await collection.countDocuments({});
+        }
+        result.mongoRows = mongoRows;
+
+        if (entry.loadedRows !== entry.sourceRows) {
+            result.errors.push(`Gravados ${entry.loadedRows} de ${entry.sourceRows} registros`);
+        }
+        if (mongoRows !== entry.sourceRows) {
+            result.errors.push(`MongoDB tem ${mongoRows} de ${entry.sourceRows} registros`);
+        }
+
+        // A amostragem precisa do banco restaurado e de uma chave inteira para sortear faixas
+        if (db && entry.sourceRows > 0) {
+            const key = await getIntegerKey(db, entry.table);
+            if (!key) {
+                result.sampleSkipped = 'tabela sem chave inteira';
+            } else if (!await hasKeyIndex(collection, key)) {
+                // Sem índice, cada faixa seria uma leitura completa da collection
+                result.sampleSkipped = `collection sem índice em ${key}`;
+            } else {
+                await sampleTable(db, collection, entry.table, key, result);
+                if (result.mismatches > 0) {
+                    result.errors.push(`${result.mismatches} divergências em ${result.sampledRows} registros amostrados`);
+                }
+            }
+        }
+    } catch (error: any) {
+        result.errors.push(String(error?.message || error));
+    }
+
+    result.passed = result.errors.length === 0;
+    return result;
+}
+
+async function main() {
+    try {
+        if (!migrationConfig.reportFile) {
+            throw new Error('MIGRATION_REPORT não informado');
+        }
+
+        const started = Date.now();
+        const report = await readLoadReport(migrationConfig.reportFile);
+        const useFirebird = report.source === 'firebird';
+        console.log(`Verificando ${report.tables.length} tabelas${useFirebird ? '' : ' (somente contagens, sem banco restaurado)'}...`);
+
+        const mongoClient = await MongoClient.connect(mongoConfig.url, { maxPoolSize: mongoConfig.maxPoolSize });
+        const mongoDb = mongoClient.db(mongoConfig.dbName);
+
+        // Tabelas verificadas em paralelo, cada worker com sua conexão ao Firebird
+        const pending = [...report.tables];
+        const results: TableVerification[] = [];
+        const worker = async () => {
+            const db = useFirebird ? await attach() : null;
+            try {
+                let entry: LoadedTable | undefined;
+                while ((entry = pending.shift()) !== undefined) {
+                    const result = await verifyTable(entry, mongoDb, db);
+                    results.push(result);
+                    if (result.passed) {
+                        console.log(`✅ ${result.table}: ${result.mongoRows} registros, ${result.sampledRows} amostrados`);
+                    } else {
+                        console.error(`❌ ${result.table}: ${result.errors.join('; ')}`);
+                    }
+                }
+            } finally {
+                if (db) db.detach();
+            }
+        };
+        await Promise.all(Array.from({ length: Math.max(1, verifyConfig.parallelism) }, worker));
+
+        await mongoClient.close();
+
+        results.sort((a, b) => a.table.localeCompare(b.table));
+        const failed = results.filter(result => !result.passed);
+        const output = {
+            passed: failed.length === 0,
+            checkedAt: new Date().toISOString(),
+            seconds: Number(((Date.now() - started) / 1000).toFixed(1)),
+            tables: results
+        };
+        await fs.promises.writeFile(verifyConfig.outputFile, JSON.stringify(output, null, 2), 'utf-8');
+
+        console.log(`\nVerificação ${output.passed ? 'aprovada' : `reprovada em ${failed.length} tabelas`} (${output.seconds}s)`);
+    } catch (error) {
+        console.error('Erro durante a verificação:', error);
+        process.exit(1);
+    }
+}
+
+main();
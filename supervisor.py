@@ -0,0 +1,162 @@
+import os
+import re
+import signal
+import subprocess
+import threading
+import time
+import logging
+from collections import deque
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+# Linhas de progresso das etapas externas (valores acumulados por tabela)
+GBAK_PROGRESS = re.compile(r'(\d+) records restored')
+MIGRATION_PROGRESS = re.compile(r'Progresso: \d+% \((\d+)/\d+\)')
+
+
+class StageStalled(Exception):
+    """A etapa parou de produzir saída ou ficou abaixo da vazão mínima"""
+
+
+class StageCancelled(Exception):
+    """A etapa foi cancelada a pedido do scheduler"""
+
+
+def kill_process_tree(process):
+    """Encerra o processo e seus filhos, sem afetar outros processos da máquina"""
+    if process.poll() is not None:
+        return
+    try:
+        if os.name == 'nt':
+            subprocess.run(['taskkill', '/F', '/T', '/PID', str(process.pid)], capture_output=True)
+        else:
+            os.killpg(process.pid, signal.SIGKILL)
+    except Exception as e:
+        logger.warning(f"Erro ao encerrar processo {process.pid}: {str(e)}")
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        logger.error(f"Processo {process.pid} não finalizou após ser encerrado")
+
+
+class StageSupervisor:
+    """Executa uma etapa externa (gbak, npm run migrate) acompanhando sua saída
+
+    A etapa é considerada travada quando não escreve nada por `stall_timeout`
+    segundos, ou quando, durante um trecho contínuo de linhas de progresso,
+    processa menos de `min_throughput` registros/s na janela de `window`
+    segundos. Qualquer outra linha (nova tabela, criação de índices) reinicia
+    a janela, e essas fases são avaliadas apenas pelo `stall_timeout`.
+    """
+
+    def __init__(self, name, progress_pattern=None, cancel_event=None):
+        load_dotenv()
+        self.name = name
+        self.progress_pattern = progress_pattern
+        self.cancel_event = cancel_event
+        self.stall_timeout = int(os.getenv('STAGE_STALL_TIMEOUT', '1800'))
+        self.min_throughput = float(os.getenv('STAGE_MIN_THROUGHPUT', '0'))
+        self.window = int(os.getenv('STAGE_THROUGHPUT_WINDOW', '300'))
+        self._lock = threading.Lock()
+
+    def _reset_window(self, now):
+        self._window_start = now
+        self._progress = deque()
+        self._last_value = 0
+
+    def _on_line(self, line):
+        now = time.time()
+        match = self.progress_pattern.search(line) if self.progress_pattern else None
+        with self._lock:
+            self.last_output = now
+            if match is None:
+                self._reset_window(now)
+                return
+            value = int(match.group(1))
+            delta = value - self._last_value if value >= self._last_value else value
+            self._last_value = value
+            self._progress.append((now, delta))
+
+    def _read_output(self, pipe, log_func):
+        for line in iter(pipe.readline, ''):
+            line = line.strip()
+            log_func(line)
+            self._on_line(line)
+        pipe.close()
+
+    def _check_stall(self, now):
+        """Retorna o motivo do travamento, ou None se a etapa está progredindo"""
+        with self._lock:
+            idle = now - self.last_output
+            if self.stall_timeout and idle > self.stall_timeout:
+                return f"sem saída há {idle:.0f}s"
+
+            if self.min_throughput <= 0 or now - self._window_start < self.window:
+                return None
+
+            while self._progress and self._progress[0][0] < now - self.window:
+                self._progress.popleft()
+            rate = sum(delta for _, delta in self._progress) / self.window
+            if rate < self.min_throughput:
+                return f"vazão de {rate:.1f} registros/s abaixo do mínimo de {self.min_throughput:g}"
+            return None
+
+    def run(self, cmd, encoding='utf-8', env=None):
+        """Executa o comando e retorna o código de saída
+
+        Lança StageStalled se a etapa travar e StageCancelled se o cancel_event
+        for sinalizado; nos dois casos só a árvore do próprio processo é encerrada.
+        """
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise StageCancelled(f"Etapa {self.name} cancelada")
+
+        # Novo grupo de processos, para poder encerrar apenas esta árvore
+        if os.name == 'nt':
+            group = {'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP}
+        else:
+            group = {'start_new_session': True}
+
+        process = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding=encoding,
+            bufsize=1,
+            env=env,
+            **group
+        )
+
+        now = time.time()
+        self.last_output = now
+        self._reset_window(now)
+
+        # Cria threads para ler stdout e stderr
+        threads = [
+            threading.Thread(target=self._read_output, args=(process.stdout, logger.info)),
+            threading.Thread(target=self._read_output, args=(process.stderr, logger.error))
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                try:
+                    return process.wait(timeout=1)
+                except subprocess.TimeoutExpired:
+                    pass
+
+                if self.cancel_event is not None and self.cancel_event.is_set():
+                    logger.warning(f"Cancelando etapa {self.name}...")
+                    kill_process_tree(process)
+                    raise StageCancelled(f"Etapa {self.name} cancelada")
+
+                reason = self._check_stall(time.time())
+                if reason:
+                    logger.error(f"Etapa {self.name} travada: {reason}. Encerrando processo {process.pid}")
+                    kill_process_tree(process)
+                    raise StageStalled(f"Etapa {self.name} travada: {reason}")
+        finally:
+            for thread in threads:
+                thread.join()
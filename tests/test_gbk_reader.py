@@ -0,0 +1,251 @@
+"""Testes do gbk_reader com backups sintéticos montados no formato do gbak (burp.h)"""
+import io
+import gzip
+import json
+import struct
+from datetime import datetime, timezone
+
+import pytest
+
+from gbk_reader import GbkReader, GbkFormatError, export_gbk
+
+
+def _num(att, value, size=4):
+    return bytes([att, size]) + value.to_bytes(size, 'little', signed=True)
+
+
+def _txt(att, value):
+    data = value.encode('latin1')
+    return bytes([att, len(data)]) + data
+
+
+def _pad(data):
+    return data + b'\0' * (-len(data) % 4)
+
+
+def _rle(data):
+    """Compressão RLE do gbak: n < 128 copia n bytes; 256 - n repete o próximo byte n vezes"""
+    out = bytearray()
+    i = 0
+    while i < len(data):
+        run = 1
+        while i + run < len(data) and run < 128 and data[i + run] == data[i]:
+            run += 1
+        if run >= 3:
+            out += bytes([256 - run, data[i]])
+            i += run
+        else:
+            literal = data[i:i + min(127, len(data) - i)]
+            out += bytes([len(literal)]) + literal
+            i += len(literal)
+    return bytes(out)
+
+
+# Campos de TESTE: (nome, atributos, offset no registro nativo)
+FIELDS = [
+    ('ID', _num(9, 8, 2) + _num(10, 4, 2), 0),
+    ('NOME', _txt(2, 'D_NOME'), 4),
+    ('VALOR', _txt(2, 'D_VALOR'), 32),
+    ('OBS', _num(9, 261, 2) + _num(10, 8, 2) + _num(11, 1, 2), 40),
+    ('DT', _num(9, 35, 2) + _num(10, 8, 2), 48),
+    ('HORA', _num(9, 13, 2) + _num(10, 4, 2), 56),
+    ('COD', _num(9, 14, 2) + _num(10, 3, 2), 60),
+]
+
+# Registros: ID, NOME, VALOR (centavos), OBS, DT (dias, 1/10000 s), HORA (1/10000 s), COD.
+# OBS (BLOB) fica fora dos documentos, como na migração pelo Firebird
+ROWS = [
+    (1, 'JOSÉ', 12345, 'observação do cliente', (59000, 36000000), 45296 * 10000 + 1234, 'ABC'),
+    (2, None, -5, None, (0, 0), 0, '   '),
+]
+
+EXPECTED = [
+    {'ID': 1, 'NOME': 'JOSÉ', 'VALOR': 123.45,
+     'DT': datetime(2020, 5, 31, 1, 0), 'HORA': datetime(1970, 1, 1, 12, 34, 56, 123400), 'COD': 'ABC'},
+    {'ID': 2, 'NOME': None, 'VALOR': -0.05,
+     'DT': datetime(1858, 11, 17), 'HORA': datetime(1970, 1, 1), 'COD': '   '},
+]
+
+
+def _xdr_record(row):
+    rid, nome, valor, obs, dt, hora, cod = row
+    nome_bytes = (nome or '').encode('cp1252')
+    data = struct.pack('>i', rid)
+    data += struct.pack('>i', len(nome_bytes)) + _pad(nome_bytes)
+    data += struct.pack('>q', valor)
+    data += b'\0' * 7 + (b'\1' if obs else b'\0')
+    data += struct.pack('>iI', *dt)
+    data += struct.pack('>I', hora)
+    data += _pad(cod.encode('cp1252'))
+    nulls = [0, nome is None, 0, obs is None, 0, 0, 0]
+    data += b''.join(struct.pack('>i', -1 if null else 0) for null in nulls)
+    return data
+
+
+def _native_record(row):
+    rid, nome, valor, obs, dt, hora, cod = row
+    nome_bytes = (nome or '').encode('cp1252')
+    data = bytearray(78)
+    struct.pack_into('<i', data, 0, rid)
+    struct.pack_into('<H', data, 4, len(nome_bytes))
+    data[6:6 + len(nome_bytes)] = nome_bytes
+    struct.pack_into('<q', data, 32, valor)
+    data[40:48] = b'\0' * 7 + (b'\1' if obs else b'\0')
+    struct.pack_into('<iI', data, 48, *dt)
+    struct.pack_into('<I', data, 56, hora)
+    data[60:63] = cod.encode('cp1252')
+    # Indicadores de nulo a partir do fim dos campos (63) alinhado em 2
+    nulls = [0, nome is None, 0, obs is None, 0, 0, 0]
+    struct.pack_into('<7h', data, 64, *(-1 if null else 0 for null in nulls))
+    return bytes(data)
+
+
+def build_gbk(transportable=True, compressed=True, unknown_record=True, data=True, relation='TESTE'):
+    """Monta um backup com os domínios, a tabela TESTE, uma view e os registros de ROWS
+
+    `relation` troca o nome da tabela na definição, mantendo TESTE na seção de dados.
+    """
+    out = bytearray([1])
+    out += _num(2, 10) + _num(4, int(compressed)) + _num(5, int(transportable)) + _txt(7, 'teste.fdb') + b'\0'
+
+    out += bytes([3]) + _txt(1, 'D_NOME') + _num(9, 37, 2) + _num(10, 20, 2) + b'\0'
+    out += bytes([3]) + _txt(1, 'D_VALOR') + _num(9, 16, 2) + _num(10, 8, 2) + _num(12, -2, 2) + b'\0'
+
+    if unknown_record:
+        # Tipo de registro que o leitor não conhece, seguido de bytes sem estrutura
+        out += bytes([28]) + b'\x01\x05PROC1\x02\x04\x10\x00\x00\x00' + b'\x99' * 12 + b'\0'
+
+    out += bytes([4]) + _txt(1, relation) + b'\0'
+    for number, (name, attrs, offset) in enumerate(FIELDS):
+        out += bytes([5]) + _txt(1, name) + attrs + _num(14, number, 2) + _num(21, number, 2)
+        if not transportable:
+            out += _num(15, offset, 2)
+        out += b'\0'
+    # Campo calculado: não faz parte do registro
+    out += bytes([5]) + _txt(1, 'CALC') + _num(9, 8, 2) + _num(10, 4, 2)
+    out += bytes([19, 4]) + (4).to_bytes(4, 'little') + b'calc' + _num(14, 7, 2) + b'\0'
+    out += bytes([11])
+
+    out += bytes([4]) + _txt(1, 'VAZIA') + b'\0'
+    out += bytes([5]) + _txt(1, 'A') + _num(9, 8, 2) + _num(10, 4, 2)
+    out += (b'' if transportable else _num(15, 0, 2)) + b'\0' + bytes([11])
+
+    out += bytes([4]) + _txt(1, 'V_TESTE') + bytes([2, 4]) + (3).to_bytes(4, 'little') + b'blr' + b'\0'
+    out += bytes([5]) + _txt(1, 'ID') + _num(9, 8, 2) + _num(10, 4, 2) + b'\0' + bytes([11])
+
+    if data:
+        out += bytes([9]) + _txt(1, 'TESTE') + b'\0'
+        # Índice da relação, gravado pelo gbak antes dos registros
+        out += bytes([6]) + _txt(1, 'PK_TESTE') + _num(2, 1, 2) + _txt(5, 'ID')
+        out += bytes([10, 4]) + (9).to_bytes(4, 'little') + b'COMPUTED' + b'\0' + b'\0'
+        for row in ROWS:
+            raw = _xdr_record(row) if transportable else _native_record(row)
+            body = _rle(raw) if compressed else raw
+            out += bytes([7]) + _num(1, len(raw)) + (_num(3, len(raw)) if transportable else b'') + bytes([2]) + body
+            obs = row[3]
+            if obs:
+                # Blob do campo OBS em dois segmentos
+                text = obs.encode('cp1252')
+                out += bytes([8]) + _num(1, 3, 2) + _num(3, 2) + bytes([5])
+                out += struct.pack('<H', 5) + text[:5] + struct.pack('<H', len(text) - 5) + text[5:]
+        out += bytes([10])
+
+        out += bytes([9]) + _txt(1, 'VAZIA') + b'\0' + bytes([10])
+
+    out += bytes([11])
+    return bytes(out)
+
+
+def read_tables(content):
+    reader = GbkReader(io.BytesIO(content), charset='cp1252')
+    return {relation.name: list(rows) for relation, rows in reader.iter_tables()}
+
+
+@pytest.mark.parametrize('transportable', [True, False], ids=['xdr', 'nativo'])
+@pytest.mark.parametrize('compressed', [True, False], ids=['comprimido', 'sem-compressao'])
+def test_le_registros(transportable, compressed):
+    tables = read_tables(build_gbk(transportable=transportable, compressed=compressed))
+    assert tables == {'TESTE': EXPECTED, 'VAZIA': []}
+
+
+def test_colunas_na_ordem_da_tabela():
+    tables = read_tables(build_gbk())
+    assert list(tables['TESTE'][0]) == ['ID', 'NOME', 'VALOR', 'DT', 'HORA', 'COD']
+
+
+def test_pula_registro_desconhecido():
+    with_unknown = read_tables(build_gbk(unknown_record=True))
+    without_unknown = read_tables(build_gbk(unknown_record=False))
+    assert with_unknown == without_unknown == {'TESTE': EXPECTED, 'VAZIA': []}
+
+
+def test_dados_sem_definicao():
+    # A seção de dados de TESTE não pode ser descartada por falta da definição
+    with pytest.raises(GbkFormatError, match='TESTE'):
+        read_tables(build_gbk(relation='OUTRA'))
+
+
+def test_tabela_sem_secao_de_dados():
+    with pytest.raises(GbkFormatError, match='TESTE, VAZIA'):
+        read_tables(build_gbk(data=False))
+
+
+def test_arquivo_que_nao_e_backup():
+    with pytest.raises(GbkFormatError):
+        read_tables(b'\x00' * 64)
+
+
+def test_backup_compactado_pelo_gbak():
+    content = bytes([1]) + _num(2, 10) + _num(10, 1) + b'\0' + bytes([11])
+    with pytest.raises(GbkFormatError):
+        read_tables(content)
+
+
+def test_registro_truncado():
+    content = build_gbk(compressed=False)
+    # Corta o backup no meio do primeiro registro de dados
+    cut = content.index(bytes([9]) + _txt(1, 'TESTE')) + 20
+    with pytest.raises(GbkFormatError):
+        read_tables(content[:cut])
+
+
+def test_export_gbk(tmp_path):
+    gbk = tmp_path / 'teste.gbk'
+    gbk.write_bytes(build_gbk())
+    manifest = export_gbk(str(gbk), str(tmp_path / 'saida'))
+
+    # A view fica de fora; a tabela vazia é exportada sem registros
+    assert [(t['table'], t['rows']) for t in manifest['tables']] == [('TESTE', 2), ('VAZIA', 0)]
+    assert json.loads((tmp_path / 'saida' / 'manifest.json').read_text('utf-8')) == manifest
+
+    with gzip.open(tmp_path / 'saida' / 'teste.jsonl.gz', 'rt', encoding='utf-8') as f:
+        first = json.loads(f.readline())
+
+    # Datas e horas em JSON estendido, interpretadas no horário local como no node-firebird
+    def as_date(value):
+        return {'$date': value.astimezone(timezone.utc).isoformat(timespec='milliseconds').replace('+00:00', 'Z')}
+
+    assert first['DT'] == as_date(EXPECTED[0]['DT'])
+    assert first['HORA'] == as_date(EXPECTED[0]['HORA'])
+    assert first['NOME'] == 'JOSÉ'
+    assert 'OBS' not in first
+
+
+def test_export_gbk_invalido(tmp_path):
+    gbk = tmp_path / 'invalido.gbk'
+    gbk.write_bytes(b'nao e um backup')
+    with pytest.raises(GbkFormatError):
+        export_gbk(str(gbk), str(tmp_path / 'saida'))
+
+
+def test_automacao_volta_para_gbak(tmp_path):
+    # automacao importa prepare_backup, que depende do py7zr
+    pytest.importorskip('py7zr')
+    from automacao import FirebirdMigration
+
+    gbk = tmp_path / 'invalido.gbk'
+    gbk.write_bytes(build_gbk()[:40])
+    migration = FirebirdMigration({'database_dir': str(tmp_path / 'restored')})
+    assert migration.read_gbk_directly(str(gbk)) is False
+    assert migration.stream_dir is None
+    assert not (tmp_path / 'restored' / 'stream').exists()